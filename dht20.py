@@ -3,16 +3,86 @@
 from machine import I2C
 from utime import sleep_ms
 
+
+def _crc8_table(polynomial: int) -> bytes:
+    """Build the lookup table for a byte-wise, MSB-first CRC-8."""
+    table = bytearray(256)
+    
+    for i in range(256):
+        crc = i
+        
+        for _ in range(8):
+            crc = ((crc << 1) ^ polynomial) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+            
+        table[i] = crc
+        
+    return bytes(table)
+
+
+# CRC-8 with polynomial x^8 + x^5 + x^4 + 1 (0x31), as used by the DHT20
+_CRC8_TABLE = _crc8_table(0x31)
+
+
+class DHT20Reading:
+    """A single temperature and relative humidity reading.
+    
+    Preallocate one and pass it to DHT20.read_into() so that taking a
+    measurement does not create any new objects.
+
+    t: temperature (°C),
+    t_adc: the 'raw' temperature as produced by the ADC,
+    rh: relative humidity (%RH),
+    rh_adc: the 'raw' relative humidity as produced by the ADC,
+    crc_ok: indicates if the data was received correctly
+    """
+    
+    __slots__ = ('t', 't_adc', 'rh', 'rh_adc', 'crc_ok')
+    
+    def __init__(self):
+        self.t = 0.0
+        self.t_adc = 0
+        self.rh = 0.0
+        self.rh_adc = 0
+        self.crc_ok = False
+
+
 class DHT20:
     """Class for the DHT20 Temperature and Humidity Sensor.
 
+    Nothing is sent to the sensor until begin() is called, so a missing
+    sensor can be retried rather than stopping the program.
+
     The datasheet can be found at http://www.aosong.com/userfiles/files/media/Data%20Sheet%20DHT20%20%20A1.pdf
+
+    initialized: whether begin() has succeeded
     """
     
-    def __init__(self, address: int, i2c: I2C):
+    def __init__(self, address: int, i2c: I2C, crc_retries: int = 0):
+        """Keyword arguments:
+        address -- the I2C address of the sensor
+        i2c -- the bus the sensor is connected to
+        crc_retries -- if non-zero, readings that fail the CRC check are
+                       discarded and re-read up to this many times before a
+                       RuntimeError is raised; if zero they are returned with
+                       'crc_ok' set to False
+        """
         self._address = address
         self._i2c = i2c
-        sleep_ms(100)
+        self._crc_retries = crc_retries
+        self._crc_retry = 0
+        self._buffer = bytearray(7)
+        self._reading = DHT20Reading()
+        self._pending = False
+        self.initialized = False
+        
+    def begin(self):
+        """Check that the DHT20 is ready, initializing it if it is not.
+        
+        Call this before taking measurements, at least 100 ms after power
+        up. Raises OSError if the sensor does not answer, and RuntimeError
+        if it answers but cannot be initialized.
+        """
+        self.initialized = False
         
         if not self.is_ready:
             self._initialize()
@@ -20,6 +90,8 @@ class DHT20:
             
             if not self.is_ready:
                 raise RuntimeError("Could not initialize the DHT20.")
+            
+        self.initialized = True
         
     @property
     def is_ready(self) -> bool:
@@ -37,33 +109,100 @@ class DHT20:
         self._i2c.writeto_mem(self._address, 0xAC, bytearray(b'\x33\x00'))
         
     def _read_measurements(self):
-        buffer = self._i2c.readfrom(self._address, 7)
+        buffer = self._buffer
+        self._i2c.readfrom_into(self._address, buffer)
         return buffer, buffer[0] & 0x80 == 0
     
-    def _crc_check(self, input_bitstring: str, check_value: str) -> bool:
-        """Calculate the CRC check of a string of bits using a fixed polynomial.
+    def _decode(self, buffer, reading: DHT20Reading, crc_ok: bool):
+        s_rh = buffer[1] << 12 | buffer[2] << 4 | buffer[3] >> 4
+        s_t = (buffer[3] << 16 | buffer[4] << 8 | buffer[5]) & 0xfffff
+        reading.rh = (s_rh / 2 ** 20) * 100
+        reading.t = ((s_t / 2 ** 20) * 200) - 50
+        reading.rh_adc = s_rh
+        reading.t_adc = s_t
+        reading.crc_ok = crc_ok
+    
+    def _crc_check(self, buffer) -> bool:
+        """Check the CRC-8 sent in the last byte of a 7-byte reading.
+        
+        The CRC (polynomial 0x31, initial value 0xFF) covers the status byte
+        and the five data bytes. It is calculated a byte at a time from a
+        precomputed table, straight from the buffer, so nothing is allocated.
         
         See https://en.wikipedia.org/wiki/Cyclic_redundancy_check
-            https://xcore.github.io/doc_tips_and_tricks/crc.html#the-initial-value
         
         Keyword arguments:
-        input_bitstring -- the data to verify
-        check_value -- the CRC received with the data
+        buffer -- the 7 bytes read from the sensor
+        """
+        table = _CRC8_TABLE
+        crc = 0xFF
+        
+        for i in range(6):
+            crc = table[crc ^ buffer[i]]
+            
+        return crc == buffer[6]
+        
+    @property
+    def measuring(self) -> bool:
+        """Check if a conversion started by start_measurement() is still to be read."""
+        return self._pending
+    
+    def start_measurement(self):
+        """Trigger a conversion without waiting for it to complete.
+        
+        The conversion takes around 80 ms. Collect it with read_into() or
+        poll(), which return straight away if it is not finished yet.
+        """
+        self._crc_retry = self._crc_retries
+        self._trigger_measurements()
+        self._pending = True
+        
+    def read_into(self, reading: DHT20Reading) -> bool:
+        """Fetch the result of start_measurement() into a reading.
+        
+        Returns False immediately if no conversion is pending or the sensor
+        is still busy, and True once the reading has been filled in. If
+        crc_retries is set, a reading which fails the CRC check triggers a
+        new conversion (and returns False) until the retries run out, at
+        which point a RuntimeError is raised.
+        
+        Keyword arguments:
+        reading -- the DHT20Reading to fill in
         """
+        if not self._pending:
+            return False
+        
+        buffer = self._buffer
+        self._i2c.readfrom_into(self._address, buffer)
         
-        polynomial_bitstring = "100110001"
-        len_input = len(input_bitstring)
-        initial_padding = check_value
-        input_padded_array = list(input_bitstring + initial_padding)
+        if buffer[0] & 0x80:
+            return False
         
-        while '1' in input_padded_array[:len_input]:
-            cur_shift = input_padded_array.index('1')
+        crc_ok = self._crc_check(buffer)
+        
+        if not crc_ok and self._crc_retries:
+            if not self._crc_retry:
+                self._pending = False
+                raise RuntimeError("DHT20 measurements failed the CRC check.")
             
-            for i in range(len(polynomial_bitstring)):
-                input_padded_array[cur_shift + i] = \
-                    str(int(polynomial_bitstring[i] != input_padded_array[cur_shift + i]))
-                
-        return '1' not in ''.join(input_padded_array)[len_input:]
+            self._crc_retry -= 1
+            self._trigger_measurements()
+            return False
+        
+        self._pending = False
+        self._decode(buffer, reading, crc_ok)
+        return True
+    
+    def poll(self):
+        """Like read_into(), using a reading owned by the sensor.
+        
+        Returns the DHT20Reading once the conversion is complete, otherwise
+        None. The same object is reused for every measurement.
+        """
+        if self.read_into(self._reading):
+            return self._reading
+        
+        return None
         
     @property
     def measurements(self) -> dict:
@@ -77,33 +216,42 @@ class DHT20:
         'rh_adc': the 'raw' relative humidity as produced by the ADC,
         'crc_ok': indicates if the data was received correctly
         """
-        self._trigger_measurements()
-        sleep_ms(50)
-        
-        data = self._read_measurements()
-        retry = 3
+        crc_retry = self._crc_retries
+        self._pending = False
         
-        while not data[1]:
-            if not retry:
-                raise RuntimeError("Could not read measurements from the DHT20.")
+        while True:
+            self._trigger_measurements()
+            sleep_ms(50)
             
-            sleep_ms(10)
             data = self._read_measurements()
-            retry -= 1
+            retry = 3
             
-        buffer = data[0]
-        s_rh = buffer[1] << 12 | buffer[2] << 4 | buffer[3] >> 4
-        s_t = (buffer[3] << 16 | buffer[4] << 8 | buffer[5]) & 0xfffff
-        rh = (s_rh / 2 ** 20) * 100
-        t = ((s_t / 2 ** 20) * 200) - 50
-        crc_ok = self._crc_check(
-            f"{buffer[0] ^ 0xFF:08b}{buffer[1]:08b}{buffer[2]:08b}{buffer[3]:08b}{buffer[4]:08b}{buffer[5]:08b}",
-            f"{buffer[6]:08b}")
+            while not data[1]:
+                if not retry:
+                    raise RuntimeError("Could not read measurements from the DHT20.")
+                
+                sleep_ms(10)
+                data = self._read_measurements()
+                retry -= 1
+                
+            buffer = data[0]
+            crc_ok = self._crc_check(buffer)
+            
+            if crc_ok or not self._crc_retries:
+                break
+            
+            if not crc_retry:
+                raise RuntimeError("DHT20 measurements failed the CRC check.")
+            
+            crc_retry -= 1
+            
+        reading = self._reading
+        self._decode(buffer, reading, crc_ok)
         
         return {
-            't': t,
-            't_adc': s_t,
-            'rh': rh,
-            'rh_adc': s_rh,
-            'crc_ok': crc_ok
+            't': reading.t,
+            't_adc': reading.t_adc,
+            'rh': reading.rh,
+            'rh_adc': reading.rh_adc,
+            'crc_ok': reading.crc_ok
         }
\ No newline at end of file
@@ -0,0 +1,73 @@
+import _thread
+
+
+class DisplayState:
+    """Everything the LCD and the ring show, passed between the two cores.
+
+    The first core writes to it through the setters and the second core
+    takes a copy with copy_into() before rendering. Both hold the lock only
+    for the few assignments involved, never across slow I2C or NeoPixel
+    writes, so neither core waits on the other's I/O. Only references are
+    copied, so nothing is allocated.
+
+    tempnow, lowtemp, hightemp: the temperatures shown on the LCD (°C), or
+                                None until the sensor has given a reading,
+    led_index: the step on the temperature scale shown on the ring,
+    online: whether the network is up,
+    message, message_until: lines shown in place of the clock, and until
+                            when (time.ticks_ms()),
+    chime_hour: an hour waiting to be chimed, or -1
+    """
+
+    __slots__ = ("lock", "tempnow", "lowtemp", "hightemp", "led_index", "online",
+                 "message", "message_until", "chime_hour")
+
+    def __init__(self):
+        self.lock = _thread.allocate_lock()
+        self.tempnow = None
+        self.lowtemp = None
+        self.hightemp = None
+        self.led_index = 0
+        self.online = False
+        self.message = None
+        self.message_until = 0
+        self.chime_hour = -1
+
+    def set_readings(self, tempnow: float, lowtemp: float, hightemp: float, led_index: int):
+        with self.lock:
+            self.tempnow = tempnow
+            self.lowtemp = lowtemp
+            self.hightemp = hightemp
+            self.led_index = led_index
+
+    def set_online(self, online: bool):
+        with self.lock:
+            self.online = online
+
+    def set_message(self, lines, until: int):
+        with self.lock:
+            self.message = lines
+            self.message_until = until
+
+    def chime(self, hour: int):
+        with self.lock:
+            self.chime_hour = hour
+
+    def take_chime(self) -> int:
+        """Return the hour waiting to be chimed, or -1, and clear it."""
+        with self.lock:
+            hour = self.chime_hour
+            self.chime_hour = -1
+
+        return hour
+
+    def copy_into(self, view):
+        """Copy everything but the pending chime into another DisplayState."""
+        with self.lock:
+            view.tempnow = self.tempnow
+            view.lowtemp = self.lowtemp
+            view.hightemp = self.hightemp
+            view.led_index = self.led_index
+            view.online = self.online
+            view.message = self.message
+            view.message_until = self.message_until
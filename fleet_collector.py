@@ -0,0 +1,202 @@
+"""Headless collector that pulls new readings from many thermoclocks at once.
+
+Every device is polled concurrently for the rows logged since the last poll
+(GET /data?since=<cursor>), the rows are tagged with the device's name, and
+they are inserted into the same table that
+house_graphs_gui_template.import_data() fills, in batches, leaving out any
+already stored (see DataStore.insert_new()). The cursor each
+device returns in its X-Next-Cursor header is saved to a small JSON file
+once that device's rows are stored, so nothing is fetched twice between
+runs and nothing is lost if an insert fails. Tables created before rows
+were tagged are brought up to date (see DataStore.migrate()).
+
+Devices are listed in the [DEVICES] section of config.ini, one per line:
+
+    [DEVICES]
+    lounge = 192.168.1.50
+    loft = 192.168.1.51:8080
+
+Usage: python fleet_collector.py [--once] [interval in seconds] [state file]
+"""
+import asyncio
+import configparser
+import json
+import sys
+from os import path, replace
+
+from pandas import DataFrame
+
+from house_graphs_gui_template import CONFIG_FILE, DataStore, get_database_credentials
+
+DEFAULT_INTERVAL_S = 900
+DEFAULT_STATE_FILE = "fleet_state.json"
+
+# Devices polled at the same time
+MAX_CONCURRENT = 16
+
+# Rows per INSERT
+BATCH_SIZE = 1000
+
+# Seconds to wait for one device before giving up until the next poll
+REQUEST_TIMEOUT_S = 30
+
+COLUMNS = ['Device', 'Date', 'Time', 'Temp', 'Humidity']
+
+
+def read_devices(config_file=CONFIG_FILE):
+    """Returns {name: (host, port)} from the [DEVICES] section of the config file."""
+    config = configparser.ConfigParser()
+    config.read(config_file)
+
+    if not config.has_section("DEVICES"):
+        raise KeyError(f"No [DEVICES] section in {config_file}.")
+
+    devices = {}
+    for name, address in config["DEVICES"].items():
+        host, _, port = address.strip().partition(":")
+        devices[name] = (host, int(port) if port else 80)
+
+    return devices
+
+
+async def fetch_since(host, port, cursor):
+    """Fetch the rows after a cursor. Returns (rows, next cursor)."""
+    reader, writer = await asyncio.open_connection(host, port)
+
+    try:
+        writer.write(f"GET /data?since={cursor} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+
+        status = (await reader.readline()).decode().split()
+        if len(status) < 2 or status[1] != "200":
+            raise OSError(f"Unexpected response: {' '.join(status)}")
+
+        next_cursor = None
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            if name.lower() == "x-next-cursor":
+                next_cursor = int(value)
+
+        if next_cursor is None:
+            raise OSError("No X-Next-Cursor header in the response.")
+
+        # The device closes the connection once the rows are sent
+        body = (await reader.read()).decode()
+    finally:
+        writer.close()
+
+    rows = []
+    for line in body.splitlines():
+        fields = line.split(',')
+        if len(fields) == 4:
+            rows.append((fields[0], fields[1], float(fields[2]), float(fields[3])))
+
+    return rows, next_cursor
+
+
+class FleetCollector:
+    def __init__(self, store, devices, state_file, batch_size=BATCH_SIZE,
+                 max_concurrent=MAX_CONCURRENT):
+        self.store = store
+        self.devices = devices
+        self.state_file = state_file
+        self.batch_size = batch_size
+        self.cursors = {}
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+
+        if path.exists(state_file):
+            with open(state_file) as f:
+                self.cursors = json.load(f)
+
+    def save_state(self):
+        # Written to a temporary file first so a crash cannot leave it half written
+        with open(self.state_file + ".tmp", "w") as f:
+            json.dump(self.cursors, f)
+        replace(self.state_file + ".tmp", self.state_file)
+
+    def store_rows(self, results):
+        """Insert fetched rows in batches and save each device's cursor once its rows are in.
+
+        Each device's rows go in one transaction, so a failed insert leaves
+        neither rows nor an advanced cursor behind and the rows are fetched
+        again next time. Returns the number of new rows stored.
+        """
+        stored = 0
+
+        for name, rows, next_cursor in results:
+            added = 0
+
+            try:
+                with self.store.engine.begin() as connection:
+                    for start in range(0, len(rows), self.batch_size):
+                        data = DataStore.normalise(DataFrame(
+                            [(name,) + row for row in rows[start:start + self.batch_size]], columns=COLUMNS))
+                        added += self.store.insert_new(connection, data)
+            except Exception as e:
+                print(f"{name}: failed to store rows: {e}")
+                continue
+
+            self.cursors[name] = next_cursor
+            self.save_state()
+            stored += added
+
+        return stored
+
+    async def poll_device(self, name):
+        host, port = self.devices[name]
+
+        async with self.semaphore:
+            try:
+                rows, next_cursor = await asyncio.wait_for(
+                    fetch_since(host, port, self.cursors.get(name, 0)), REQUEST_TIMEOUT_S)
+            except (OSError, ValueError, asyncio.TimeoutError) as e:
+                print(f"{name} ({host}): {e}")
+                return None
+
+        print(f"{name} ({host}): {len(rows)} new rows")
+        return name, rows, next_cursor
+
+    async def poll(self):
+        """Poll every device once. Returns the number of rows stored."""
+        results = await asyncio.gather(*(self.poll_device(name) for name in self.devices))
+        results = [result for result in results if result is not None]
+
+        if not results:
+            return 0
+
+        # Inserts run off the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, self.store_rows, results)
+
+    async def run(self, interval_s=DEFAULT_INTERVAL_S):
+        while True:
+            try:
+                stored = await self.poll()
+                print(f"{stored} rows stored")
+            except Exception as e:
+                print(f"Poll failed: {e}")
+
+            await asyncio.sleep(interval_s)
+
+
+async def main():
+    args = sys.argv[1:]
+    once = "--once" in args
+    args = [arg for arg in args if arg != "--once"]
+    interval_s = int(args[0]) if len(args) > 0 else DEFAULT_INTERVAL_S
+    state_file = args[1] if len(args) > 1 else DEFAULT_STATE_FILE
+
+    store = DataStore(*get_database_credentials())
+    store.migrate()
+    collector = FleetCollector(store, read_devices(), state_file)
+
+    if once:
+        print(f"{await collector.poll()} rows stored")
+    else:
+        await collector.run(interval_s)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,18 +1,23 @@
-from tkinter import BOTH, NORMAL, TOP, LEFT, DISABLED, X, BOTTOM, ttk, messagebox, filedialog, Tk
-from pandas import read_sql, to_datetime, read_csv
-from matplotlib.pyplot import subplots, Normalize
+from tkinter import BOTH, NORMAL, TOP, LEFT, RIGHT, DISABLED, X, BOTTOM, ttk, messagebox, filedialog, Tk
+from pandas import read_sql, read_csv, to_datetime
+from matplotlib.figure import Figure
 from matplotlib.dates import date2num, MonthLocator, DateFormatter
 from matplotlib.collections import LineCollection
-from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.colors import LinearSegmentedColormap, Normalize
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from sqlalchemy import create_engine
-from datetime import datetime
-from numpy import array, concatenate, amin, amax, reshape
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.types import LargeBinary, Text
+from datetime import datetime, date, timedelta
+from collections import OrderedDict
+from queue import Queue, Empty
+import threading
+from numpy import asarray, column_stack, diff, flatnonzero, insert, nan, stack
 import sys
 from os import path
 
 import configparser
 import os
+import pickle
 
 def get_config_path():
     if getattr(sys, 'frozen', False):
@@ -24,6 +29,9 @@ def get_config_path():
 
 CONFIG_FILE = get_config_path()
 
+# The columns of the readings table, in order
+READING_COLUMNS = ('Device', 'Date', 'Time', 'Temp', 'Humidity', 'Timestamp')
+
 def get_database_credentials():
     config = configparser.ConfigParser()
 
@@ -62,199 +70,722 @@ def get_database_credentials():
 
     return mysql_username, mysql_password, mysql_server, database_name
 
+def get_cache_settings():
+    """Returns (number of results held in memory, directory to persist them in or None).
+
+    Set in an optional [CACHE] section of the config file; an empty
+    directory turns persistence off.
+    """
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    cache = config["CACHE"] if config.has_section("CACHE") else {}
+    directory = cache.get("directory", os.path.join(os.path.expanduser("~"), ".house_graphs_cache"))
+    return int(cache.get("size", 16)), directory or None
+
+class DataStore:
+    """Database access for the viewer.
+
+    Holds one engine for the lifetime of the app, so connections are pooled
+    and reused rather than opened for every plot. Queries are bounded by
+    date range in SQL and select only the columns needed.
+
+    Results are kept in a least-recently-used cache keyed by table and date
+    range, so going back to a year already plotted needs only one indexed
+    COUNT. import_data() invalidates the ranges it touches. If a cache
+    directory is given the results are also saved there for the next
+    launch. As the collectors may add rows at any time, a cached result,
+    in memory or saved, is only used if the number of raw readings in its
+    range still matches the number counted before it was queried.
+    """
+
+    def __init__(self, mysql_username, mysql_password, mysql_server, database_name,
+                 cache_size=16, cache_dir=None):
+        # Pooled connections are checked before use and recycled before
+        # the server's idle timeout closes them
+        self.engine = create_engine(
+            f'mysql+mysqlconnector://{mysql_username}:{mysql_password}@{mysql_server}/{database_name}',
+            pool_pre_ping=True, pool_recycle=3600)
+        # The raw readings table is named after the database
+        self.table = database_name
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
+        self._cache = OrderedDict()
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def ensure_indexes(self):
+        """Index Date in the readings table, and in daily_avg and daily_min_max if they are tables.
+
+        Nothing but indexes is changed, so this is safe to run whenever the
+        viewer opens. A Date held as TEXT cannot be indexed whole, and is
+        left alone; the readings table's is converted by migrate().
+        """
+        tables = set(inspect(self.engine).get_table_names())
+
+        for table in (self.table, 'daily_avg', 'daily_min_max'):
+            if table in tables and not self._index_date(table):
+                hint = " Run with --migrate to convert it." if table == self.table else ""
+                print(f"Date in {table} is stored as text, so is not indexed.{hint}")
+
+    def _index_date(self, table):
+        # Returns False if Date is a type MySQL cannot index whole
+        inspector = inspect(self.engine)
+
+        if any(index['column_names'][:1] == ['Date'] for index in inspector.get_indexes(table)):
+            return True
+
+        column = next((column for column in inspector.get_columns(table) if column['name'] == 'Date'), None)
+
+        if column is None or isinstance(column['type'], (Text, LargeBinary)):
+            return False
+
+        with self.engine.begin() as connection:
+            connection.execute(text(f"CREATE INDEX ix_{table}_Date ON `{table}` (Date)"))
+
+        return True
+
+    def ensure_schema(self):
+        """Create the readings table, or add what one made by an older version lacks.
+
+        Readings are tagged with a Device, and carry a Timestamp made from
+        Date and Time, which is filled in for any rows still without one.
+        MySQL commits each ALTER at once, so every step checks for itself
+        whether it is needed, in case an earlier run stopped part way.
+        Stored values are never rewritten; see migrate(). An index on
+        (Device, Timestamp) lets imports skip readings already stored.
+        """
+        inspector = inspect(self.engine)
+
+        if self.table not in inspector.get_table_names():
+            with self.engine.begin() as connection:
+                connection.execute(text(
+                    f"CREATE TABLE `{self.table}` (Device VARCHAR(32), Date VARCHAR(10), Time VARCHAR(8), "
+                    "Temp DOUBLE, Humidity DOUBLE, Timestamp DATETIME, "
+                    f"INDEX ix_{self.table}_Date (Date), "
+                    f"INDEX ix_{self.table}_Device_Timestamp (Device, Timestamp))"))
+            return
+
+        columns = {column['name'] for column in inspector.get_columns(self.table)}
+
+        with self.engine.begin() as connection:
+            if 'Device' not in columns:
+                connection.execute(text(f"ALTER TABLE `{self.table}` ADD COLUMN Device VARCHAR(32)"))
+
+            if 'Timestamp' not in columns:
+                connection.execute(text(f"ALTER TABLE `{self.table}` ADD COLUMN Timestamp DATETIME"))
+
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                f"UPDATE `{self.table}` SET Timestamp = STR_TO_DATE(CONCAT(Date, ' ', Time), '%Y-%m-%d %H:%i:%s') "
+                "WHERE Timestamp IS NULL"))
+
+            if not any(index['column_names'][:2] == ['Device', 'Timestamp']
+                       for index in inspector.get_indexes(self.table)):
+                connection.execute(text(
+                    f"CREATE INDEX ix_{self.table}_Device_Timestamp ON `{self.table}` (Device, Timestamp)"))
+
+        self._index_date(self.table)
+
+    def migrate(self):
+        """Bring a readings table made by an older version fully up to date.
+
+        After ensure_schema(), Date and Time held as TEXT, as pandas made
+        them, are rewritten from Timestamp in the one format normalise()
+        uses, then narrowed so Date can be indexed. Columns of other types,
+        such as DATE and TIME, are left as they are, and nothing is narrowed
+        while any value would not fit. This rewrites the whole table, so it
+        is run by the collectors as they start, or with --migrate, and never
+        by the viewer.
+        """
+        self.ensure_schema()
+        columns = {column['name']: column['type'] for column in inspect(self.engine).get_columns(self.table)}
+        narrow = [(name, length, pattern)
+                  for name, length, pattern in (('Date', 10, '%Y-%m-%d'), ('Time', 8, '%H:%i:%s'))
+                  if isinstance(columns[name], (Text, LargeBinary))]
+
+        if not narrow:
+            return
+
+        with self.engine.begin() as connection:
+            for name, _, pattern in narrow:
+                connection.execute(text(
+                    f"UPDATE `{self.table}` SET {name} = DATE_FORMAT(Timestamp, '{pattern}') "
+                    "WHERE Timestamp IS NOT NULL"))
+
+            too_long = connection.execute(text(
+                f"SELECT COUNT(*) FROM `{self.table}` WHERE " +
+                " OR ".join(f"CHAR_LENGTH({name}) > {length}" for name, length, _ in narrow))).scalar()
+
+        if too_long:
+            print(f"Not narrowing Date and Time in {self.table}: {too_long} rows have values which would not fit.")
+            return
+
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                f"ALTER TABLE `{self.table}` " +
+                ", ".join(f"MODIFY COLUMN {name} VARCHAR({length})" for name, length, _ in narrow)))
+
+        self._index_date(self.table)
+
+    @staticmethod
+    def normalise(frame):
+        """Adds a Timestamp made from Date and Time, and rewrites both in one format.
+
+        Rows whose date or time cannot be read are dropped.
+        """
+        stamps = to_datetime(frame['Date'].astype(str) + ' ' + frame['Time'].astype(str),
+                             format='%Y-%m-%d %H:%M:%S', errors='coerce')
+        valid = stamps.notna()
+        frame = frame[valid].copy()
+        stamps = stamps[valid]
+        frame['Timestamp'] = stamps
+        frame['Date'] = stamps.dt.strftime('%Y-%m-%d')
+        frame['Time'] = stamps.dt.strftime('%H:%M:%S')
+        return frame
+
+    def insert_new(self, connection, frame):
+        """Insert the readings whose (Device, Timestamp) is not already stored. Returns the number added.
+
+        Every writer (CSV imports and both collectors) goes through here, so
+        a reading which reaches the table by more than one of them is only
+        stored once. The frame needs the columns of the readings table, as
+        normalise() leaves them. It is put in a staging table and copied
+        across with a single INSERT ... SELECT. The staging table is
+        TEMPORARY, so it is private to the connection and concurrent
+        writers cannot touch each other's rows, and creating it does not
+        end the transaction the caller is in.
+        """
+        staging = f"{self.table}_staging"
+        frame = frame.drop_duplicates(subset=['Device', 'Timestamp'])
+
+        if frame.empty:
+            return 0
+
+        # As plain Python values, which the driver can send
+        rows = frame[list(READING_COLUMNS)].astype(object)
+        rows = rows.where(rows.notna(), None).to_dict('records')
+
+        for row, stamp in zip(rows, frame['Timestamp'].dt.to_pydatetime()):
+            row['Timestamp'] = stamp
+
+        connection.execute(text(f"CREATE TEMPORARY TABLE IF NOT EXISTS `{staging}` LIKE `{self.table}`"))
+        connection.execute(text(f"DELETE FROM `{staging}`"))
+        connection.execute(text(
+            f"INSERT INTO `{staging}` ({', '.join(READING_COLUMNS)}) "
+            f"VALUES ({', '.join(':' + column for column in READING_COLUMNS)})"), rows)
+
+        return connection.execute(text(
+            f"INSERT INTO `{self.table}` ({', '.join(READING_COLUMNS)}) "
+            f"SELECT {', '.join(READING_COLUMNS)} FROM `{staging}` s "
+            f"WHERE NOT EXISTS (SELECT 1 FROM `{self.table}` r "
+            "WHERE r.Device <=> s.Device AND r.Timestamp = s.Timestamp)")).rowcount
+
+    def import_csv(self, file_path, device=None, chunksize=20000, progress=None):
+        """Stream a CSV of readings into the readings table, skipping readings already stored.
+
+        The file is read chunksize rows at a time, so it is never held in
+        memory whole, and each chunk is stored by insert_new() in its own
+        transaction, so importing the same file twice adds nothing. The
+        cached results for the dates imported are invalidated.
+
+        Returns (rows read, rows added).
+
+        device -- the device the readings came from, or None for untagged
+        progress -- called with the fraction of the file read, rows read and rows added
+        """
+        size = max(os.path.getsize(file_path), 1)
+        read = added = 0
+        first = last = None
+        self.ensure_schema()
+
+        try:
+            # One connection throughout, which keeps the staging table
+            with open(file_path, newline='') as f, self.engine.connect() as connection:
+                for chunk in read_csv(f, chunksize=chunksize, usecols=['Date', 'Time', 'Temperature', 'Humidity']):
+                    read += len(chunk)
+                    chunk = self.normalise(chunk.rename(columns={'Temperature': 'Temp'}))
+                    chunk.insert(0, 'Device', device)
+
+                    if len(chunk):
+                        with connection.begin():
+                            added += self.insert_new(connection, chunk)
+
+                        stamps = chunk['Timestamp']
+                        first = stamps.min() if first is None else min(first, stamps.min())
+                        last = stamps.max() if last is None else max(last, stamps.max())
+
+                    if progress:
+                        progress(min(f.tell() / size, 1.0), read, added)
+        finally:
+            # Including when stopped part way, as the chunks so far are stored
+            if first is not None:
+                self.invalidate(first.date(), last.date() + timedelta(days=1))
+
+        return read, added
+
+    def import_path(self, import_path, device=None, progress=None):
+        """Import a CSV file, or every CSV file in a directory.
+
+        In a directory each file's name (without .csv) is used as its device
+        unless one is given. Returns (files, rows read, rows added).
+
+        progress -- called with the file, the fraction of it read, rows read and rows added
+        """
+        directory = path.isdir(import_path)
+
+        if directory:
+            files = sorted(path.join(import_path, name) for name in os.listdir(import_path)
+                           if name.lower().endswith('.csv'))
+        else:
+            files = [import_path]
+
+        read = added = 0
+
+        for file_path in files:
+            file_device = device
+
+            if file_device is None and directory:
+                file_device = path.splitext(path.basename(file_path))[0]
+
+            def report(fraction, file_read, file_added, file_path=file_path):
+                # Totals across every file so far
+                progress(file_path, fraction, read + file_read, added + file_added)
+
+            file_read, file_added = self.import_csv(file_path, file_device, progress=report if progress else None)
+            read += file_read
+            added += file_added
+
+        return len(files), read, added
+
+    def _params(self, start, end):
+        # Dates compare as YYYY-MM-DD strings whether stored as text or DATE
+        return {'start': start.isoformat(), 'end': end.isoformat()}
+
+    def _fingerprint(self, start, end):
+        # Cheap with the Date index; changes whenever rows in the range are added
+        query = text(f"SELECT COUNT(*) FROM `{self.table}` WHERE Date >= :start AND Date < :end")
+
+        with self.engine.connect() as connection:
+            return connection.execute(query, self._params(start, end)).scalar()
+
+    def _cache_path(self, key):
+        table, start, end = key
+        return os.path.join(self.cache_dir, f"{table}_{start.isoformat()}_{end.isoformat()}.pkl")
+
+    def _load(self, key, fingerprint):
+        if not self.cache_dir or not os.path.exists(self._cache_path(key)):
+            return None
+
+        try:
+            with open(self._cache_path(key), "rb") as f:
+                saved, frame = pickle.load(f)
+        except Exception:
+            return None
+
+        return frame if saved == fingerprint else None
+
+    def _save(self, key, fingerprint, frame):
+        if not self.cache_dir:
+            return
+
+        try:
+            with open(self._cache_path(key), "wb") as f:
+                pickle.dump((fingerprint, frame), f)
+        except OSError as e:
+            print(f"Could not save {self._cache_path(key)}: {e}")
+
+    def _query(self, table, columns, start, end):
+        key = (table, start, end)
+        # Counted before the query, so rows added while it runs leave the
+        # result stale by the next count and it is fetched again
+        fingerprint = self._fingerprint(start, end)
+        cached = self._cache.get(key)
+
+        if cached is not None and cached[0] == fingerprint:
+            self._cache.move_to_end(key)
+            return cached[1]
+
+        frame = self._load(key, fingerprint)
+
+        if frame is None:
+            query = text(f"SELECT {', '.join(columns)} FROM `{table}` "
+                         "WHERE Date >= :start AND Date < :end ORDER BY Date")
+            frame = read_sql(query, con=self.engine, params=self._params(start, end), parse_dates=['Date'])
+            self._save(key, fingerprint, frame)
+
+        self._cache[key] = (fingerprint, frame)
+        self._cache.move_to_end(key)
+
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return frame
+
+    def invalidate(self, start, end):
+        """Forget cached results overlapping the dates from start up to, but not including, end."""
+        for key in list(self._cache):
+            if key[1] < end and start < key[2]:
+                del self._cache[key]
+
+        if not self.cache_dir:
+            return
+
+        for name in os.listdir(self.cache_dir):
+            try:
+                _, first, last = name[:-len(".pkl")].rsplit("_", 2)
+                overlaps = date.fromisoformat(first) < end and start < date.fromisoformat(last)
+            except ValueError:
+                continue
+
+            if overlaps:
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def daily_avg(self, start, end):
+        """Daily averages for dates from start up to, but not including, end."""
+        return self._query('daily_avg', ('Date', 'AvgTemperature', 'AvgHumidity'), start, end)
+
+    def daily_min_max(self, start, end):
+        """Daily minimum and maximum temperatures for dates from start up to, but not including, end."""
+        return self._query('daily_min_max', ('Date', 'MinTemperature', 'MaxTemperature'), start, end)
+
+class Cancelled(Exception):
+    """Raised inside background work once the user has cancelled it."""
+
+class BackgroundRunner:
+    """Runs the slow work (queries, imports, building figures) off the Tk thread.
+
+    Jobs run one at a time, in the order they were started, on a worker
+    thread, so the window stays responsive. Each job has a kind, and
+    starting one cancels any earlier job of the same kind (a newer plot
+    replaces an older one), while a job of another kind waits its turn
+    behind them (a plot started during an import runs once it is done).
+    Each job is given a report(message, fraction=None) function for
+    progress, which raises Cancelled once the job has been cancelled, so
+    work stops at its next report. Progress, results and errors are passed
+    back through queues that the Tk thread polls with root.after(), so only
+    the Tk thread ever touches a widget. The progress shown, and what the
+    Cancel button stops, is the job being worked on; once cancelled it is
+    shown as cancelling until it has stopped.
+    """
+
+    POLL_MS = 50
+
+    def __init__(self, root, status_label, progress_bar, cancel_button):
+        self.root = root
+        self.status_label = status_label
+        self.progress_bar = progress_bar
+        self.cancel_button = cancel_button
+        self._jobs = Queue()
+        # Started and not yet finished, oldest first, including any
+        # cancelled but still running
+        self._active = []
+        self._polling = False
+        # A daemon thread, so closing the window never waits on a query
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        while True:
+            job = self._jobs.get()
+
+            if job['cancelled'].is_set():
+                job['done'].set()
+                continue
+
+            try:
+                job['result'] = job['work'](job['report'])
+            except Exception as e:
+                job['error'] = e
+
+            job['done'].set()
+
+    def start(self, kind, message, work, on_done, on_error=None):
+        """Run work(report) in the background, then on_done(result) on the Tk thread.
+
+        on_error(exception) is called instead if it fails; by default the
+        error is shown in a message box.
+
+        kind -- what the job does, e.g. 'plot'; replaces earlier jobs of the same kind
+        """
+        for job in [job for job in self._active if job['kind'] == kind]:
+            self._cancel(job)
+
+        job = {'kind': kind, 'work': work, 'on_done': on_done, 'on_error': on_error,
+               'messages': Queue(), 'latest': (message, None), 'cancelled': threading.Event(),
+               'done': threading.Event(), 'result': None, 'error': None}
+
+        def report(message, fraction=None):
+            if job['cancelled'].is_set():
+                raise Cancelled()
+
+            job['messages'].put((message, fraction))
+
+        job['report'] = report
+        self._active.append(job)
+        self._jobs.put(job)
+        self._update()
+
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.POLL_MS, self._poll)
+
+    def cancel(self):
+        """Cancel the job being worked on, if any. Its result is thrown away."""
+        if self._active:
+            self._cancel(self._active[0])
+            self._update()
+
+    def _cancel(self, job):
+        # The job stays active until the worker has let go of it
+        job['cancelled'].set()
+
+    def _update(self):
+        if not self._active:
+            self.progress_bar.stop()
+            self.cancel_button.pack_forget()
+            self.progress_bar.pack_forget()
+            self.status_label.pack_forget()
+            return
+
+        head = self._active[0]
+
+        if head['cancelled'].is_set():
+            message, fraction = "Cancelling...", None
+        else:
+            message, fraction = head['latest']
+
+        waiting = sum(not job['cancelled'].is_set() for job in self._active[1:])
+
+        if waiting:
+            message += f" ({waiting} more waiting)"
+
+        self.status_label.config(text=message)
+
+        if fraction is None:
+            if str(self.progress_bar['mode']) != 'indeterminate':
+                self.progress_bar.config(mode='indeterminate')
+                self.progress_bar.start(10)
+        else:
+            self.progress_bar.stop()
+            self.progress_bar.config(mode='determinate', value=fraction * 100)
+
+        if not self.cancel_button.winfo_ismapped():
+            self.cancel_button.pack(side=RIGHT, padx=(5, 0))
+            self.progress_bar.pack(side=RIGHT, padx=(5, 0))
+            self.status_label.pack(side=RIGHT, padx=(5, 0))
+
+    def _poll(self):
+        for job in list(self._active):
+            while True:
+                try:
+                    job['latest'] = job['messages'].get_nowait()
+                except Empty:
+                    break
+
+            if not job['done'].is_set():
+                continue
+
+            self._active.remove(job)
+
+            if job['cancelled'].is_set():
+                continue
+
+            if job['error'] is not None:
+                if job['on_error']:
+                    job['on_error'](job['error'])
+                else:
+                    messagebox.showerror("Error", f"An error occurred: {job['error']}")
+            else:
+                job['on_done'](job['result'])
+
+        self._update()
+
+        if self._active:
+            self.root.after(self.POLL_MS, self._poll)
+        else:
+            self._polling = False
+
+# Fetches the data and builds the figure. Runs in the background.
+def build_figure(year, store, report):
+    # Query only the year requested
+    start_date = date(year, 1, 1)
+    end_date = date(year + 1, 1, 1)
+
+    report(f"Loading {year}...")
+    avg_filtered = store.daily_avg(start_date, end_date)
+    min_max_filtered = store.daily_min_max(start_date, end_date)
+
+    if avg_filtered.empty or min_max_filtered.empty:
+        raise ValueError(f"No data available for the year {year}.")
+
+    report(f"Plotting {year}...")
+
+    # Plot data. A Figure rather than pyplot, which must only be used
+    # from the Tk thread; the tight layout is applied when it is drawn.
+    fig = Figure(figsize=(10, 10), tight_layout={'pad': 1.0})
+    axs = fig.subplots(3, 1)
+    fig.suptitle(f"House Data for {year}", fontsize=16)
+
+    # Plot daily average temperature with gradient
+    dates = date2num(avg_filtered['Date'])
+    temperatures = avg_filtered['AvgTemperature'].values
+    norm_temp = Normalize(temperatures.min(), temperatures.max())
+
+    cmap_temp = LinearSegmentedColormap.from_list("temp_gradient", ["blue", "lightgreen", "red"])
+    segments_temp, colours_temp = gradient_segments(dates, temperatures)
+    lc_temp = LineCollection(segments_temp, cmap=cmap_temp, norm=norm_temp)
+    lc_temp.set_array(colours_temp)
+    lc_temp.set_linewidth(2)
+    axs[0].add_collection(lc_temp)
+
+    axs[0].set_xlim(datetime(year, 1, 1), datetime(year, 12, 31))
+    axs[0].set_ylim(temperatures.min() - 2, temperatures.max() + 2)
+    axs[0].set_title(f"Daily Average Temperature for {year}")
+    axs[0].xaxis.set_major_locator(MonthLocator())
+    axs[0].xaxis.set_major_formatter(DateFormatter('%b'))
+    axs[0].grid(True)
+
+    # Plot daily average humidity with gradient
+    humidities = avg_filtered['AvgHumidity'].values
+    norm_hum = Normalize(humidities.min(), humidities.max())
+
+    cmap_hum = LinearSegmentedColormap.from_list("hum_gradient", ["cyan", "blue"])
+    segments_hum, colours_hum = gradient_segments(dates, humidities)
+    lc_hum = LineCollection(segments_hum, cmap=cmap_hum, norm=norm_hum)
+    lc_hum.set_array(colours_hum)
+    lc_hum.set_linewidth(2)
+    axs[1].add_collection(lc_hum)
+
+    axs[1].set_xlim(datetime(year, 1, 1), datetime(year, 12, 31))
+    axs[1].set_ylim(humidities.min() - 5, humidities.max() + 5)
+    axs[1].set_title(f"Daily Average Humidity for {year}")
+    axs[1].xaxis.set_major_locator(MonthLocator())
+    axs[1].xaxis.set_major_formatter(DateFormatter('%b'))
+    axs[1].grid(True)
+
+    # Plot min and max temperatures
+    # Convert dates to numeric values
+    dates = date2num(min_max_filtered['Date'])
+    min_temps = min_max_filtered['MinTemperature'].values
+    max_temps = min_max_filtered['MaxTemperature'].values
+
+    # Plot Min Temperature
+    axs[2].plot(*break_gaps(dates, min_temps), label='Min Temp', color='blue')
+
+    # Plot Max Temperature
+    axs[2].plot(*break_gaps(dates, max_temps), label='Max Temp', color='red')
+
+    axs[2].set_xlim(datetime(year, 1, 1), datetime(year, 12, 31))
+    axs[2].set_title(f"Daily Min and Max Temperatures for {year}")
+    axs[2].xaxis.set_major_locator(MonthLocator())
+    axs[2].xaxis.set_major_formatter(DateFormatter('%b'))
+    axs[2].grid(True)
+    axs[2].legend()
+
+    return fig
+
+# Displays a figure built by build_figure(). Runs on the Tk thread.
+def show_figure(fig, year, frame, save_button):
+    # Clear previous plots and display the new one
+    for widget in frame.winfo_children():
+        widget.destroy()
+
+    canvas = FigureCanvasTkAgg(fig, master=frame)
+    canvas_widget = canvas.get_tk_widget()
+    canvas_widget.pack(fill=BOTH, expand=True)
+    canvas.draw()
+
+    # Enable the save button
+    def save_as():
+        default_filename = f"House_Data_for_{year}.png" 
+        file_path = filedialog.asksaveasfilename(defaultextension=".png", 
+                                                 filetypes=[("PNG files", "*.png"), ("All files", "*.*")], 
+                                                 initialfile=default_filename)
+        if file_path:
+            fig.savefig(file_path, dpi=300, bbox_inches='tight')
+            messagebox.showinfo("Save Successful", f"Graph saved as {file_path}")
+
+    save_button.config(command=save_as, state=NORMAL)
+
 # Function to fetch data and plot
-def plot_data(year, root, frame, save_button):
+def plot_data(year, root, frame, save_button, store, runner):
     try:
         # Expand window to full screen
         root.state('zoomed')
-        
-        # Get stored credentials
-        mysql_username, mysql_password, mysql_server, database_name = get_database_credentials()
-
-        # Database connection
-        db_connection = create_engine(f'mysql+mysqlconnector://{mysql_username}:{mysql_password}@{mysql_server}/{database_name}')
-
-        # Query data
-        daily_avg = read_sql('SELECT * FROM daily_avg', con=db_connection)
-        daily_min_max = read_sql('SELECT * FROM daily_min_max', con=db_connection)
-
-        # Ensure required columns exist
-        required_columns_avg = {'Date', 'AvgTemperature', 'AvgHumidity'}
-        required_columns_min_max = {'Date', 'MinTemperature', 'MaxTemperature'}
-        if not required_columns_avg.issubset(daily_avg.columns) or not required_columns_min_max.issubset(daily_min_max.columns):
-            raise KeyError("Required columns are missing in the database query results.")
-
-        # Convert 'Date' to datetime
-        daily_avg['Date'] = to_datetime(daily_avg['Date'])
-        daily_min_max['Date'] = to_datetime(daily_min_max['Date'])
-
-        # Filter data by year
-        start_date = datetime(year, 1, 1)
-        end_date = datetime(year, 12, 31)
-
-        avg_filtered = daily_avg[(daily_avg['Date'] >= start_date) & (daily_avg['Date'] <= end_date)]
-        min_max_filtered = daily_min_max[(daily_min_max['Date'] >= start_date) & (daily_min_max['Date'] <= end_date)]
-
-        if avg_filtered.empty or min_max_filtered.empty:
-            raise ValueError(f"No data available for the year {year}.")
-
-        # Plot data
-        fig, axs = subplots(3, 1, figsize=(10, 10))
-        fig.suptitle(f"House Data for {year}", fontsize=16)
-
-        # Plot daily average temperature with gradient
-        dates = date2num(avg_filtered['Date'])
-        temperatures = avg_filtered['AvgTemperature'].values
-        norm_temp = Normalize(temperatures.min(), temperatures.max())
-
-        cmap_temp = LinearSegmentedColormap.from_list("temp_gradient", ["blue", "lightgreen", "red"])
-        for segment_dates, segment_values in split_data(dates, temperatures):
-            segments_temp = [[[segment_dates[i], segment_values[i]], [segment_dates[i + 1], segment_values[i + 1]]]
-                             for i in range(len(segment_dates) - 1)]
-            lc_temp = LineCollection(segments_temp, cmap=cmap_temp, norm=norm_temp)
-            lc_temp.set_array(array(segment_values))
-            lc_temp.set_linewidth(2)
-            axs[0].add_collection(lc_temp)
-
-        axs[0].set_xlim(datetime(year, 1, 1), datetime(year, 12, 31))
-        axs[0].set_ylim(temperatures.min() - 2, temperatures.max() + 2)
-        axs[0].set_title(f"Daily Average Temperature for {year}")
-        axs[0].xaxis.set_major_locator(MonthLocator())
-        axs[0].xaxis.set_major_formatter(DateFormatter('%b'))
-        axs[0].grid(True)
-
-        # Plot daily average humidity with gradient
-        humidities = avg_filtered['AvgHumidity'].values
-        norm_hum = Normalize(humidities.min(), humidities.max())
-
-        cmap_hum = LinearSegmentedColormap.from_list("hum_gradient", ["cyan", "blue"])
-        for segment_dates, segment_values in split_data(dates, humidities):
-            segments_hum = [[[segment_dates[i], segment_values[i]], [segment_dates[i + 1], segment_values[i + 1]]]
-                            for i in range(len(segment_dates) - 1)]
-            lc_hum = LineCollection(segments_hum, cmap=cmap_hum, norm=norm_hum)
-            lc_hum.set_array(array(segment_values))
-            lc_hum.set_linewidth(2)
-            axs[1].add_collection(lc_hum)
-
-        axs[1].set_xlim(datetime(year, 1, 1), datetime(year, 12, 31))
-        axs[1].set_ylim(humidities.min() - 5, humidities.max() + 5)
-        axs[1].set_title(f"Daily Average Humidity for {year}")
-        axs[1].xaxis.set_major_locator(MonthLocator())
-        axs[1].xaxis.set_major_formatter(DateFormatter('%b'))
-        axs[1].grid(True)
-
-        # Plot min and max temperatures
-        # Convert dates to numeric values
-        dates = date2num(min_max_filtered['Date'])
-        min_temps = min_max_filtered['MinTemperature'].values
-        max_temps = min_max_filtered['MaxTemperature'].values
-
-        # Plot Min Temperature
-        for i, (segment_dates, segment_values) in enumerate(split_data(dates, min_temps)):
-            axs[2].plot(segment_dates, segment_values, label='Min Temp' if i == 0 else "", color='blue')
-
-        # Plot Max Temperature
-        for i, (segment_dates, segment_values) in enumerate(split_data(dates, max_temps)):
-            axs[2].plot(segment_dates, segment_values, label='Max Temp' if i == 0 else "", color='red')
-        
-
-        axs[2].set_xlim(datetime(year, 1, 1), datetime(year, 12, 31))
-        axs[2].set_title(f"Daily Min and Max Temperatures for {year}")
-        axs[2].xaxis.set_major_locator(MonthLocator())
-        axs[2].xaxis.set_major_formatter(DateFormatter('%b'))
-        axs[2].grid(True)
-        axs[2].legend()
-        
-
-        # Add spacing between subplots
-        fig.tight_layout(pad=1.0)
-
-        # Clear previous plots and display the new one
-        for widget in frame.winfo_children():
-            widget.destroy()
-
-        canvas = FigureCanvasTkAgg(fig, master=frame)
-        canvas_widget = canvas.get_tk_widget()
-        canvas_widget.pack(fill=BOTH, expand=True)
-        canvas.draw()
-
-        # Enable the save button
-        def save_as():
-            default_filename = f"House_Data_for_{year}.png" 
-            file_path = filedialog.asksaveasfilename(defaultextension=".png", 
-                                                     filetypes=[("PNG files", "*.png"), ("All files", "*.*")], 
-                                                     initialfile=default_filename)
-            if file_path:
-                fig.savefig(file_path, dpi=300, bbox_inches='tight')
-                messagebox.showinfo("Save Successful", f"Graph saved as {file_path}")
-
-        save_button.config(command=save_as, state=NORMAL)
+
+        # The query and figure are worked on in the background
+        runner.start('plot', f"Loading {year}...", lambda report: build_figure(year, store, report),
+                     lambda fig: show_figure(fig, year, frame, save_button))
 
     except Exception as e:
         messagebox.showerror("Error", f"An error occurred: {e}")
-        
-def import_data(root):
+
+def import_data(root, store, runner, folder=False):
     try:
-        # Open file dialog to select CSV
-        file_path = filedialog.askopenfilename(
-            title="Select CSV File",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
-        )
-        if not file_path:
+        # Open a dialog to select a CSV file, or a folder of them
+        if folder:
+            import_path = filedialog.askdirectory(title="Select Folder of CSV Files")
+        else:
+            import_path = filedialog.askopenfilename(
+                title="Select CSV File",
+                filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+            )
+        if not import_path:
             return
 
-        if not path.exists(file_path):
-            raise FileNotFoundError(f"The file '{file_path}' does not exist.")
+        if not path.exists(import_path):
+            raise FileNotFoundError(f"The file '{import_path}' does not exist.")
 
-        mysql_username, mysql_password, mysql_server, database_name = get_database_credentials()
-        db_connection = create_engine(f'mysql+mysqlconnector://{mysql_username}:{mysql_password}@{mysql_server}/{database_name}')
+        from tkinter.simpledialog import askstring
+        device = askstring("Device", "Which device are these readings from?\n"
+                           + ("(Leave blank to use each file's name.)" if folder else "(Leave blank if untagged.)"),
+                           parent=root)
+        if device is None:
+            return
 
-        data = read_csv(file_path)
+        # Runs in the background; progress is reported after every chunk,
+        # which is also where a cancelled import stops
+        def work(report):
+            def progress(file_path, fraction, read, added):
+                report(f"Importing {path.basename(file_path)} ({added} new rows)", fraction)
 
-        # Rename columns if necessary to match the table schema
-        data.rename(columns={
-            'Date': 'Date',
-            'Time': 'Time',
-            'Temperature': 'Temp', 
-            'Humidity': 'Humidity'
-        }, inplace=True)
+            return store.import_path(import_path, device.strip() or None, progress)
 
-        # Insert data into the table using pandas
-        try:
-            data.to_sql(database_name, con=db_connection, if_exists='append', index=False, method='multi')
-            messagebox.showinfo("Success", f"Data from {file_path} imported successfully into '{database_name}'!")
-        except Exception as pandas_error:
-            messagebox.showerror("Error", f"Failed to import data into '{database_name}': {pandas_error}")
+        def done(result):
+            files, read, added = result
+            messagebox.showinfo("Success", f"{read} rows read from {files} file(s); {added} new rows imported "
+                                f"into '{store.table}' and {read - added} already there or unreadable.")
 
-    except Exception as e:
-        messagebox.showerror("Error", f"An error occurred: {e}")
+        def failed(pandas_error):
+            messagebox.showerror("Error", f"Failed to import data into '{store.table}': {pandas_error}")
 
-def split_data(dates, values):
-    """Splits data into segments, ensuring there are no gaps in the time series."""
-    segments = []
-    segment_dates = []
-    segment_values = []
+        runner.start('import', "Importing...", work, done, failed)
 
-    for i in range(len(dates)):
-        if i > 0 and (dates[i] - dates[i - 1]) > 1:  # If there's a gap, start a new segment
-            if segment_dates:
-                segments.append((segment_dates, segment_values))
-            segment_dates = []
-            segment_values = []
+    except Exception as e:
+        messagebox.showerror("Error", f"An error occurred: {e}")
 
-        segment_dates.append(dates[i])
-        segment_values.append(values[i])
+def gradient_segments(dates, values, max_gap=1):
+    """Builds the line segments joining each point to the next, leaving out those across gaps in the time series.
 
-    if segment_dates:
-        segments.append((segment_dates, segment_values))  # Add the last segment
+    Returns an array of segments, shaped (segments, 2, 2) as LineCollection
+    expects, and the value each segment is coloured by (the one at its start).
+    """
+    dates = asarray(dates, dtype=float)
+    values = asarray(values, dtype=float)
+    points = column_stack((dates, values))
+    joined = diff(dates) <= max_gap
+    return stack((points[:-1], points[1:]), axis=1)[joined], values[:-1][joined]
 
-    return segments
+def break_gaps(dates, values, max_gap=1):
+    """Inserts a NaN at each gap in the time series, so a single plot() leaves the gaps unjoined."""
+    gaps = flatnonzero(diff(dates) > max_gap) + 1
+    return insert(asarray(dates, dtype=float), gaps, nan), insert(asarray(values, dtype=float), gaps, nan)
 
 # GUI setup
 def main():
     root = Tk()
     root.title("Temperature and Humidity Data Viewer")
-    root.geometry("550x70")  # Initial small size
+    root.geometry("950x70")  # Initial small size
     
     # Bring window to the front
     root.lift()
@@ -262,8 +793,8 @@ def main():
     root.after(100, lambda: root.attributes('-topmost', False))
     root.focus_force()
     
-    # Get stored credentials
-    mysql_username, mysql_password, mysql_server, database_name = get_database_credentials()
+    # One database connection pool for the lifetime of the app
+    store = DataStore(*get_database_credentials(), *get_cache_settings())
     
     # Ensure the process exits when the window is closed
     root.protocol("WM_DELETE_WINDOW", lambda: (root.destroy(), exit()))
@@ -277,19 +808,35 @@ def main():
     year_entry.pack(side=LEFT)
 
     def handle_enter(event):
-        on_plot_button_click(year_entry, root, plot_frame, save_button)
+        on_plot_button_click(year_entry, root, plot_frame, save_button, store, runner)
 
     year_entry.bind("<Return>", handle_enter)
 
-    plot_button = ttk.Button(input_frame, text="Plot Data", command=lambda: on_plot_button_click(year_entry, root, plot_frame, save_button))
+    plot_button = ttk.Button(input_frame, text="Plot Data", command=lambda: on_plot_button_click(year_entry, root, plot_frame, save_button, store, runner))
     plot_button.pack(side=LEFT, padx=(5, 0))
 
     save_button = ttk.Button(input_frame, text="Save as PNG", state=DISABLED)
     save_button.pack(side=LEFT, padx=(5, 0))
     
-    import_button = ttk.Button(input_frame, text="Import CSV", command=lambda: import_data(root))
+    import_button = ttk.Button(input_frame, text="Import CSV", command=lambda: import_data(root, store, runner))
     import_button.pack(side=LEFT, padx=(5, 0))
 
+    import_folder_button = ttk.Button(input_frame, text="Import Folder", command=lambda: import_data(root, store, runner, folder=True))
+    import_folder_button.pack(side=LEFT, padx=(5, 0))
+
+    # Progress of work in the background; only shown while there is some
+    cancel_button = ttk.Button(input_frame, text="Cancel")
+    progress_bar = ttk.Progressbar(input_frame, length=120, mode='determinate')
+    status_label = ttk.Label(input_frame)
+    runner = BackgroundRunner(root, status_label, progress_bar, cancel_button)
+    cancel_button.config(command=runner.cancel)
+
+    def indexes_failed(e):
+        # Plotting still works without them, just more slowly
+        print(f"Could not create indexes: {e}")
+
+    runner.start('indexes', "Checking indexes...", lambda report: store.ensure_indexes(), lambda result: None, indexes_failed)
+
     style = ttk.Style()
     style.configure("TButton", foreground="black", background="lightgray")  # Ensure text and background contrast
 
@@ -301,14 +848,17 @@ def main():
 
     root.mainloop()
 
-def on_plot_button_click(year_entry, root, plot_frame, save_button):
+def on_plot_button_click(year_entry, root, plot_frame, save_button, store, runner):
     try:
         year = int(year_entry.get())
         if year < 1900 or year > datetime.now().year:
             raise ValueError("Please enter a valid year.")
-        plot_data(year, root, plot_frame, save_button)
+        plot_data(year, root, plot_frame, save_button, store, runner)
     except ValueError as ve:
         messagebox.showwarning("Invalid Input", str(ve))
 
 if __name__ == "__main__":
-    main()
+    if "--migrate" in sys.argv[1:]:
+        DataStore(*get_database_credentials()).migrate()
+    else:
+        main()
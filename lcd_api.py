@@ -142,13 +142,18 @@ class LcdApi:
             self.implied_newline = (char != '\n')
         if self.cursor_y >= self.num_lines:
             self.cursor_y = 0
-        self.move_to(self.cursor_x, self.cursor_y)
+        # The controller auto-increments its address after each data write,
+        # so the cursor only needs repositioning when we wrap onto a new line.
+        if self.cursor_x == 0:
+            self.move_to(self.cursor_x, self.cursor_y)
 
     def putstr(self, string):
         # Write the indicated string to the LCD at the current cursor
         # position and advances the cursor position appropriately.
+        self.hal_begin_batch()
         for char in string:
             self.putchar(char)
+        self.hal_end_batch()
 
     def custom_char(self, location, charmap):
         # Write a character to one of the 8 CGRAM locations, available
@@ -171,6 +176,18 @@ class LcdApi:
         # If desired, a derived HAL class will implement this function.
         pass
 
+    def hal_begin_batch(self):
+        # Marks the start of a group of writes which the hal layer may buffer
+        # and send together. Calls may be nested.
+        # If desired, a derived HAL class will implement this function.
+        pass
+
+    def hal_end_batch(self):
+        # Marks the end of a group of writes. Once the outermost batch ends,
+        # everything buffered must have been sent to the LCD.
+        # If desired, a derived HAL class will implement this function.
+        pass
+
     def hal_write_command(self, cmd):
         # Write a command to the LCD.
         # It is expected that a derived HAL class will implement this function.
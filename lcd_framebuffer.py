@@ -0,0 +1,120 @@
+from lcd_api import LcdApi
+
+SPACE = 0x20
+
+class LcdFramebuffer:
+
+    # Keeps a shadow copy of the HD44780 DDRAM so that each redraw only sends
+    # the cells which actually changed.
+    #
+    # Callers describe the whole screen with render(), or update parts of it
+    # with write(), and then flush() works out the dirty runs on each line and
+    # emits one cursor move plus the data bytes for each run. The 5 ms clear
+    # and home commands are only needed once, when the shadow is first synced.
+
+    # Unchanged cells between two dirty runs are rewritten rather than skipped
+    # if doing so is no more expensive than a cursor move (one command byte).
+    MAX_GAP = 1
+
+    def __init__(self, lcd: LcdApi):
+        self.lcd = lcd
+        self.num_lines = lcd.num_lines
+        self.num_columns = lcd.num_columns
+        self._pending = [bytearray(b' ' * self.num_columns) for _ in range(self.num_lines)]
+        self._shadow = [bytearray(b' ' * self.num_columns) for _ in range(self.num_lines)]
+        self._valid = False
+        self._cursor_x = -1
+        self._cursor_y = -1
+
+    def invalidate(self):
+        # Forget what is on the display, e.g. after something else has
+        # written to the LCD directly. The next flush() redraws from scratch.
+        self._valid = False
+
+    def clear(self):
+        # Blanks the pending frame. Nothing is sent until flush().
+        for row in self._pending:
+            for x in range(self.num_columns):
+                row[x] = SPACE
+
+    def write(self, cursor_x, cursor_y, string):
+        # Places a string into the pending frame at the given position.
+        # Text running past the end of the line is truncated.
+        if not 0 <= cursor_y < self.num_lines:
+            return
+        row = self._pending[cursor_y]
+        for char in string:
+            if cursor_x >= self.num_columns:
+                break
+            if cursor_x >= 0:
+                row[cursor_x] = ord(char)
+            cursor_x += 1
+
+    def render(self, frame):
+        # Replaces the pending frame with the given lines (missing lines and
+        # short lines are padded with spaces) and flushes it to the display.
+        for y in range(self.num_lines):
+            row = self._pending[y]
+            line = frame[y] if y < len(frame) else ""
+            length = min(len(line), self.num_columns)
+            for x in range(length):
+                row[x] = ord(line[x])
+            for x in range(length, self.num_columns):
+                row[x] = SPACE
+        return self.flush()
+
+    def flush(self):
+        # Sends the difference between the pending frame and the shadow copy.
+        # Returns the number of data bytes written.
+        if not self._valid:
+            self._sync()
+        written = 0
+        self.lcd.hal_begin_batch()
+        for y in range(self.num_lines):
+            pending = self._pending[y]
+            shadow = self._shadow[y]
+            x = 0
+            while x < self.num_columns:
+                if pending[x] == shadow[x]:
+                    x += 1
+                    continue
+                start = x
+                end = x + 1
+                gap = 0
+                x += 1
+                while x < self.num_columns and gap <= self.MAX_GAP:
+                    if pending[x] != shadow[x]:
+                        end = x + 1
+                        gap = 0
+                    else:
+                        gap += 1
+                    x += 1
+                self._write_run(start, y, pending, end)
+                written += end - start
+                x = end
+        self.lcd.hal_end_batch()
+        return written
+
+    def _sync(self):
+        # Brings the real display and the shadow copy into a known state.
+        self.lcd.clear()
+        for row in self._shadow:
+            for x in range(self.num_columns):
+                row[x] = SPACE
+        self._cursor_x = 0
+        self._cursor_y = 0
+        self._valid = True
+
+    def _write_run(self, start, y, pending, end):
+        # The address counter already points at the right cell if this run
+        # continues on from the previous one, so skip the cursor move then.
+        if start != self._cursor_x or y != self._cursor_y:
+            self.lcd.move_to(start, y)
+        shadow = self._shadow[y]
+        for x in range(start, end):
+            self.lcd.hal_write_data(pending[x])
+            shadow[x] = pending[x]
+        self._cursor_x = end
+        self._cursor_y = y
+        self.lcd.cursor_x = end
+        self.lcd.cursor_y = y
@@ -12,13 +12,34 @@ MASK_E  = 0x04       # P2
 SHIFT_BACKLIGHT = 3  # P3
 SHIFT_DATA      = 4  # P4-P7
 
+# Every byte sent to the LCD costs four PCF8574 writes: each nibble is put
+# on P4-P7 with E high, then again with E low to latch it.
+WRITES_PER_BYTE = 4
+
+# Number of LCD bytes which can be queued into a single I2C transaction.
+# This covers a whole 16x2 framebuffer flush including its cursor moves.
+BATCH_BYTES = 40
+
 class I2cLcd(LcdApi):
     
     #Implements a HD44780 character LCD connected via PCF8574 on I2C
+    #
+    # Writes are packed into a preallocated buffer. Outside of a batch each
+    # command or data byte goes out as one 4-byte transaction; inside a batch
+    # (see hal_begin_batch) everything is sent in as few transactions as the
+    # buffer allows, without allocating on the heap.
 
-    def __init__(self, i2c, i2c_addr, num_lines, num_columns):
+    def __init__(self, i2c, i2c_addr, num_lines, num_columns, batch_bytes=BATCH_BYTES):
         self.i2c = i2c
         self.i2c_addr = i2c_addr
+        self._buf = bytearray(WRITES_PER_BYTE * batch_bytes)
+        self._buf_view = memoryview(self._buf)
+        # Slices of the buffer are created on first use and then reused, so
+        # steady state transfers do not allocate
+        self._views = [None] * (batch_bytes + 1)
+        self._len = 0
+        self._batch_depth = 0
+        self._byte = bytearray(1)
         self.i2c.writeto(self.i2c_addr, bytes([0]))
         utime.sleep_ms(20)   # Allow LCD time to powerup
         # Send reset 3 times
@@ -48,39 +69,67 @@ class I2cLcd(LcdApi):
         
     def hal_backlight_on(self):
         # Allows the hal layer to turn the backlight on
-        self.i2c.writeto(self.i2c_addr, bytes([1 << SHIFT_BACKLIGHT]))
-        gc.collect()
+        self._send()
+        self._byte[0] = 1 << SHIFT_BACKLIGHT
+        self.i2c.writeto(self.i2c_addr, self._byte)
         
     def hal_backlight_off(self):
         #Allows the hal layer to turn the backlight off
-        self.i2c.writeto(self.i2c_addr, bytes([0]))
-        gc.collect()
+        self._send()
+        self._byte[0] = 0
+        self.i2c.writeto(self.i2c_addr, self._byte)
+
+    def hal_begin_batch(self):
+        # Queue writes until the matching hal_end_batch()
+        self._batch_depth += 1
+
+    def hal_end_batch(self):
+        # Send whatever was queued once the outermost batch is finished
+        self._batch_depth -= 1
+        if self._batch_depth <= 0:
+            self._batch_depth = 0
+            self._send()
         
     def hal_write_command(self, cmd):
         # Write a command to the LCD. Data is latched on the falling edge of E.
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                (((cmd >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                ((cmd & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
+        self._queue(self.backlight << SHIFT_BACKLIGHT, cmd)
         if cmd <= 3:
             # The home and clear commands require a worst case delay of 4.1 msec
+            self._send()
             utime.sleep_ms(5)
-        gc.collect()
+        elif not self._batch_depth:
+            self._send()
 
     def hal_write_data(self, data):
         # Write data to the LCD. Data is latched on the falling edge of E.
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                (((data >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                ((data & 0x0f) << SHIFT_DATA))      
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
\ No newline at end of file
+        self._queue(MASK_RS | (self.backlight << SHIFT_BACKLIGHT), data)
+        if not self._batch_depth:
+            self._send()
+
+    def _queue(self, flags, value):
+        # Packs the four E-strobe writes for one byte into the buffer,
+        # sending what is already queued first if the buffer is full.
+        if self._len == len(self._buf):
+            self._send()
+        buf = self._buf
+        i = self._len
+        byte = flags | (((value >> 4) & 0x0f) << SHIFT_DATA)
+        buf[i] = byte | MASK_E
+        buf[i + 1] = byte
+        byte = flags | ((value & 0x0f) << SHIFT_DATA)
+        buf[i + 2] = byte | MASK_E
+        buf[i + 3] = byte
+        self._len = i + WRITES_PER_BYTE
+
+    def _send(self):
+        # Sends everything queued so far as a single I2C transaction
+        length = self._len
+        if not length:
+            return
+        index = length // WRITES_PER_BYTE
+        view = self._views[index]
+        if view is None:
+            view = self._buf_view[:length]
+            self._views[index] = view
+        self.i2c.writeto(self.i2c_addr, view)
+        self._len = 0
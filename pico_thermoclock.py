@@ -1,20 +1,30 @@
 # General imports
 from machine import Pin, ADC, I2C, UART
+import machine
 import time
+import _thread
+import uasyncio as asyncio
 import uos
 import random
-from dht20 import DHT20
+from dht20 import DHT20, DHT20Reading
 from neopixel import NeoPixel
 from lcd_api import LcdApi
 from pico_i2c_lcd import I2cLcd
+from lcd_framebuffer import LcdFramebuffer
 from pico_thermoclock_constants import *
-import socket
-import select 
+from web_server import WebServer
+from ring_log import RingLog, CSV_HEADER
+from scheduler import Scheduler
+from ring_animation import RingAnimator
+from temperature_scale import TemperatureScale
+from time_sync import TimeSync
+from wifi_manager import WifiManager, DISCONNECTED
+from telemetry import Telemetry
+from rollups import Rollups, Bucket, HOUR, DAY
+from sensor_filter import SensorFilter
+from display_state import DisplayState
+from power_manager import PowerManager
 
-# Network imports
-import network
-import socket
-import struct
 
 # Configuration
 i2c1_sda = Pin(I2C_SDA_PIN)
@@ -25,7 +35,9 @@ led = Pin(LED_PIN, Pin.OUT)
 dht20 = DHT20(DHT20_ADDRESS, i2c1)
 lcdi2c = I2C(LCD_INTERFACE, sda=machine.Pin(I2C_SDA_PIN), scl=machine.Pin(I2C_SCL_PIN), freq=400000)
 lcd = I2cLcd(lcdi2c, LCD_ADDRESS, LCD_ROWS, LCD_COLUMNS)
+screen = LcdFramebuffer(lcd)
 ring = NeoPixel(Pin(NEOPIXEL_PIN), NEOPIXEL_LCD_TOTAL)
+animator = RingAnimator(ring)
 uart = UART(0, baudrate=115200)
 uart.init(115200, bits=8, parity=None, stop=1, tx=Pin(0), rx=Pin(1))
 uos.dupterm(uart)
@@ -33,72 +45,115 @@ uos.dupterm(uart)
 # What is the ideal temperature for you in 
 IDEAL_TEMP = 20
 
-# Create a temperature/LED dictionary for our scale
-# Temperature is the key (left), LED index is the value (right)
-LEDdict = {
-  IDEAL_TEMP - 5: 0,
-  IDEAL_TEMP - 4.5: 1,
-  IDEAL_TEMP - 4: 2,
-  IDEAL_TEMP - 3.5: 3,
-  IDEAL_TEMP - 3: 4,
-  IDEAL_TEMP - 2.5: 5,
-  IDEAL_TEMP - 2: 6,
-  IDEAL_TEMP - 1.5: 7,
-  IDEAL_TEMP - 1: 8,
-  IDEAL_TEMP - 0.5: 9,
-  IDEAL_TEMP: 10, # Top-middle LED
-  IDEAL_TEMP + 0.5: 11,
-  IDEAL_TEMP + 1: 12,
-  IDEAL_TEMP + 1.5: 13,
-  IDEAL_TEMP + 2: 14,
-  IDEAL_TEMP + 2.5: 15,
-  IDEAL_TEMP + 3: 16,
-  IDEAL_TEMP + 3.5: 17,
-  IDEAL_TEMP + 4: 18,
-  IDEAL_TEMP + 4.5: 19,
-  IDEAL_TEMP + 5: 20
-}
-
-# Possible colours, from blue, to green, to red
-LEDcolours = [
-    (0,0,10),
-    (0,1,9),
-    (0,2,8),
-    (0,3,7),
-    (0,4,6),
-    (0,5,5),
-    (0,6,4),
-    (0,7,3),
-    (0,8,2),
-    (0,9,1),
-    (0,10,0), # Top-middle LED
-    (1,9,0),
-    (2,8,0),
-    (3,7,0),
-    (4,6,0),
-    (5,5,0),
-    (6,4,0),
-    (7,3,0),
-    (8,2,0),
-    (9,1,0),
-    (10,0,0)
-]
+# Build the temperature/LED lookup tables for our scale once at boot.
+# The ideal temperature is on the top LED; colder moves left and bluer,
+# hotter moves right and redder.
+scale = TemperatureScale(IDEAL_TEMP, TEMP_SCALE_SPAN, TEMP_SCALE_RESOLUTION,
+                         NEOPIXEL_LCD_TOTAL, NEOPIXEL_TOP_LED, TEMP_SCALE_GRADIENT)
     
-# Grab data from the sensor dictionary
-measurements = dht20.measurements
+# A single reading object is reused for every measurement
+reading = DHT20Reading()
+
+# Every reading goes through the filter; the display, LEDs and logs only
+# ever see the filtered values
+sensor = SensorFilter(SENSOR_FILTER_SIZE, SENSOR_EMA_ALPHA, SENSOR_MAX_STEP)
+
+# Take the first reading before the loop starts. A sensor which is missing
+# or keeps failing is given up on after a few attempts, so the clock and the
+# web server still start; the sensor task carries on trying.
+for attempt in range(SENSOR_BOOT_ATTEMPTS):
+    try:
+        if not dht20.initialized:
+            time.sleep(0.1)
+            dht20.begin()
+        dht20.start_measurement()
+        for poll in range(SENSOR_READ_POLLS):
+            time.sleep(0.01)
+            if dht20.read_into(reading):
+                sensor.add(reading)
+                break
+    except (OSError, RuntimeError) as e:
+        print("DHT20: " + str(e))
+        dht20.initialized = False
+    if sensor.accepted:
+        break
     
 # Create temp and humidity variables
-# From initial readings
-lowtemp = round(measurements['t'],1)
-hightemp = round(measurements['t'],1)
+# From initial readings, or None until there is one
+tempnow = None
+humidity = None
+if sensor.accepted:
+    tempnow = round(sensor.t,1)
+    humidity = round(sensor.rh, 1)
+else:
+    print("*** No reading from the sensor ***")
+lowtemp = tempnow
+hightemp = tempnow
+LEDindex = 0
+
+# What the LCD and the ring show. In DUAL_CORE mode they are drawn by the
+# second core, which only reads this, under its lock.
+display = DisplayState()
+
+# The DHT20 and the LCD share the I2C bus, which must not be used from
+# both cores at once
+bus_lock = _thread.allocate_lock()
+
+# Light sleep while nothing is on show, if LOW_POWER is set, and how long
+# has been spent awake and asleep
+power = PowerManager(LOW_POWER_MIN_SLEEP_MS, LOW_POWER_MAX_SLEEP_MS)
+
+# Created once the clock has been set
+scheduler = None
+date_shown = False
 
-# For the current display
-display = ""
 firstLine = ""
 lastLine = ""
 
+# The binary ring log, if LOG_STORAGE is "ring"
+log = None
+
+# Hourly and daily aggregates of every reading, kept on flash
+rollups = Rollups(ROLLUP_PATH, ROLLUP_HOURS, ROLLUP_DAYS)
+
+def format_stamp(now):
+    return "{:04d}-{:02d}-{:02d},{:02d}:{:02d}:{:02d}".format(now[0], now[1], now[2], now[3], now[4], now[5])
+
+def parse_stamp(stamp):
+    # Turns "YYYY-MM-DD,HH:MM:SS" (the time is optional) into seconds
+    date, _, clock = stamp.partition(",")
+    fields = [int(x) for x in date.split("-")] + [int(x) for x in clock.split(":") if x]
+    fields += [0] * (6 - len(fields))
+    return time.mktime((fields[0], fields[1], fields[2], fields[3], fields[4], fields[5], 0, 0, 0))
+
+def read_last_line(path):
+    # Reads backwards from the end of the file a block at a time until a
+    # whole line has been found, so the cost does not depend on the file size
+    size = uos.stat(path)[6]
+    with open(path, "rb") as file:
+        position = size
+        tail = b""
+        while position > 0:
+            step = min(64, position)
+            position -= step
+            file.seek(position)
+            tail = file.read(step) + tail
+            # Ignore the newline which ends the last line
+            start = tail.rfind(b"\n", 0, len(tail) - 1)
+            if start >= 0:
+                return tail[start + 1:].decode()
+        return tail.decode()
+
 def file_setup():
-    global firstLine, lastLine
+    global firstLine, lastLine, log
+    if LOG_STORAGE == "ring":
+        # Fixed-size records in a preallocated file; CSV is only produced
+        # when the data is downloaded
+        log = RingLog(RING_LOG_PATH, RING_LOG_CAPACITY)
+        last = log.last()
+        lastLine = format_stamp(time.localtime(last[0])) if last else ""
+        return
+
     # Create a header if there is not one already
     try:
         file = open("data.csv","r")
@@ -118,327 +173,517 @@ def file_setup():
         file.close()
 
     # Get the date and time from the last line in the file.
-    file = open("data.csv","a+")
-    lastLine = file.readlines()[-1][:19]
-    file.close()
+    lastLine = read_last_line("data.csv")[:19]
 
 
-# Connect to the internet
-def connect():
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    wlan.connect(SSID, PASSWORD)
-    i = 6
-    while wlan.isconnected() == False:
-        lcd.move_to(3, 0) 
-        lcd.putstr("Connecting")
-        lcd.move_to(i, 1) 
-        lcd.putstr(".")
-        i = i + 1
-        time.sleep(1)
-    lcd.clear()
-    ip = wlan.ifconfig()[0]
-    lcd.move_to(3, 0) 
-    lcd.putstr("Connected!")
-    lcd.move_to(1, 1) 
-    lcd.putstr(ip)
-    print(f'Connected on {ip}')
-    time.sleep(3)
-    lcd.clear()
-    return ip
-    
-def start_web_server(connection):
-    # Accept connections if available
-    ready_to_read, _, _ = select.select([connection], [], [], 0)  # Non-blocking select
-    if connection in ready_to_read:
-        client, addr = connection.accept()
-        print(f"Connection from {addr}")
-
-        # Handle HTTP requests
+def show_message(lines, ms):
+    # Shown on the LCD in place of the clock for ms milliseconds
+    display.set_message(lines, time.ticks_add(time.ticks_ms(), ms))
+
+def on_wifi_change(wifi):
+    display.set_online(wifi.connected)
+    # The onboard LED shows whether we are connected
+    if wifi.connected:
+        led.on()
+        show_message(("   Connected!", " " + wifi.ip), 3000)
+    else:
+        led.off()
+
+INDEX_HTML = """
+<html>
+<body>
+    <h1>Raspberry Pi Temperature Data</h1>
+    <a href="/data.csv" download>Download Data.csv</a><br><br>
+    <a href="/delete" onclick="return confirmDelete()">Delete Data.csv</a>
+</body>
+</html>
+
+<script>
+    function confirmDelete() {
+        return confirm("Are you sure you want to delete Data.csv?");
+    }
+</script>
+"""
+
+async def serve_index(request, response):
+    # Serve a basic webpage with links
+    await response.send(200, "text/html", INDEX_HTML)
+
+async def send_log_csv(response, seq, end):
+    # Export ring log records as CSV, a buffer at a time
+    view = memoryview(response.buffer)
+    while True:
+        size, seq = log.read_csv_into(seq, response.buffer, end)
+        if not size:
+            break
+        await response.write(view[:size])
+
+async def serve_data_csv(request, response):
+    if log is not None:
+        await response.start(200, "text/csv")
+        await response.write(CSV_HEADER.encode())
+        await send_log_csv(response, 0, log.next)
+        return
+    # Stream the CSV file in chunks rather than loading it into memory.
+    # Range requests let a client resume or fetch only the end of the file.
+    await response.send_file_range(request, "data.csv", "text/csv")
+
+def find_row_after(file, stamp, lo, hi):
+    # Returns the byte offset of the first row in [lo, hi) whose timestamp
+    # is later than stamp, or hi if there is none. lo and hi must be row
+    # boundaries. Rows are appended in time order, so this is a binary search
+    # over byte offsets and only reads a handful of lines.
+    while lo < hi:
+        mid = (lo + hi) // 2
+        # Find the first row starting at or after mid
+        file.seek(mid - 1)
+        file.readline()
+        row = file.tell()
+        if row >= hi:
+            row = lo
+        file.seek(row)
+        line = file.readline()
+        if line[:19].decode() > stamp:
+            hi = row
+        else:
+            lo = row + len(line)
+    return lo
+
+async def serve_data(request, response):
+    # Returns only the rows appended after the 'since' cursor, which is
+    # either a byte offset from a previous X-Next-Cursor header or a
+    # timestamp such as 2025-01-31T18:00:00. Without a cursor, every row is
+    # sent. The header line is never included.
+    since = request.query.get("since", "0")
+    stamp = since.replace("T", ",").replace(" ", ",")
+    if log is not None:
+        # With the ring log the cursor is a record sequence number
+        end = log.next
         try:
-            request = client.recv(1024).decode('utf-8')
-            if 'GET /data.csv' in request:
-                # Serve the CSV file
-                response_headers = (
-                    "HTTP/1.1 200 OK\r\n"
-                    "Content-Type: text/csv\r\n"
-                    "Connection: close\r\n\r\n"
-                )
-                client.sendall(response_headers.encode())
-                with open('data.csv', 'r') as f:
-                    client.sendall(f.read().encode())
-            elif 'GET /delete' in request:
-                # Handle delete request
-                try:
-                    # Check if the file exists
-                    if uos.stat('data.csv'):
-                        uos.remove('data.csv')  # Delete the file
-                        file_setup()  # Recreate it
-                        response = (
-                            "HTTP/1.1 200 OK\r\n"
-                            "Content-Type: text/plain\r\n"
-                            "Connection: close\r\n\r\n"
-                            "File deleted and new file created."
-                        )
-                    else:
-                        # File does not exist
-                        response = (
-                            "HTTP/1.1 404 Not Found\r\n"
-                            "Content-Type: text/plain\r\n"
-                            "Connection: close\r\n\r\n"
-                            "File not found."
-                        )
-                except Exception as e:
-                    # Handle any unexpected errors
-                    response = (
-                        "HTTP/1.1 500 Internal Server Error\r\n"
-                        "Content-Type: text/plain\r\n"
-                        "Connection: close\r\n\r\n"
-                        f"An error occurred: {e}"
-                    )
-                finally:
-                    client.sendall(response.encode())
-            else:
-                # Serve a basic webpage with links
-                html = """
-                <html>
-                <body>
-                    <h1>Raspberry Pi Temperature Data</h1>
-                    <a href="/data.csv" download>Download Data.csv</a><br><br>
-                    <a href="/delete" onclick="return confirmDelete()">Delete Data.csv</a>
-                </body>
-                </html>
-
-                <script>
-                    function confirmDelete() {
-                        return confirm("Are you sure you want to delete Data.csv?");
-                    }
-                </script>
-                """
-                response_headers = (
-                    "HTTP/1.1 200 OK\r\n"
-                    "Content-Type: text/html\r\n"
-                    "Connection: close\r\n\r\n"
-                )
-                client.sendall(response_headers.encode() + html.encode())
-        except Exception as e:
-            print(f"Error: {e}")
-        finally:
-            client.close()
+            seq = int(since) if since.isdigit() else log.find_after(parse_stamp(stamp))
+        except ValueError:
+            await response.send(400, "text/plain", "Invalid cursor.")
+            return
+        # A cursor from before the log was recreated starts again
+        if seq > end:
+            seq = 0
+        await response.start(200, "text/csv", headers="X-Next-Cursor: {}\r\n".format(end))
+        await send_log_csv(response, seq, end)
+        return
+    size = uos.stat("data.csv")[6]
+    with open("data.csv", "rb") as file:
+        start = len(file.readline())
+        if since.isdigit():
+            offset = int(since)
+            # A cursor from before the file was recreated starts again
+            if offset > size:
+                offset = 0
+            offset = max(offset, start)
+        else:
+            offset = find_row_after(file, stamp, start, size)
+    await response.send_file("data.csv", "text/csv", offset, size - offset,
+                             headers="X-Next-Cursor: {}\r\n".format(size))
 
-# Main setup for the web server
-def setup_web_server():
-    address = ('0.0.0.0', 80)  # Bind to all available interfaces on port 80
-    connection = socket.socket()
-    connection.bind(address)
-    connection.listen(1)
-    print("Web server running...")
-    return connection
-
-# Ensures that time.localtime() is correct
-def set_time():
-    NTP_QUERY = bytearray(48)
-    NTP_QUERY[0] = 0x1B
-    addr = socket.getaddrinfo(HOST, 123)[0][-1]
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+async def serve_stats(request, response):
+    # The latest hourly and daily aggregates as JSON; ?hours=N&days=N
+    # chooses how many of each (24 and 7 by default)
     try:
-        s.settimeout(1)
-        res = s.sendto(NTP_QUERY, addr)
-        msg = s.recv(48)
-    finally:
-        s.close()
-    val = struct.unpack("!I", msg[40:44])[0]
-    t = val - NTP_DELTA    
-    tm = time.gmtime(t)
-
-    # Adjust for DST based on UK rules
-    current_time = time.localtime(t)
-    last_sunday_march = max(25, (31 - (current_time[6] - 6) % 7))
-    last_sunday_october = max(25, (31 - (current_time[6] - 6) % 7))
-    dst_starts = time.mktime((current_time[0], 3, last_sunday_march, 1, 0, 0, 0, 0, -1))
-    dst_ends = time.mktime((current_time[0], 10, last_sunday_october, 2, 0, 0, 0, 0, -1))
-
-    if t >= dst_starts and t < dst_ends:
-        t += 3600  # Add 1 hour for DST
-        machine.RTC().datetime((tm[0], tm[1], tm[2], tm[6] + 1, tm[3] + 1, tm[4], tm[5], 0))
+        hours = min(int(request.query.get("hours", "24")), ROLLUP_HOURS)
+        days = min(int(request.query.get("days", "7")), ROLLUP_DAYS)
+    except ValueError:
+        await response.send(400, "text/plain", "Invalid count.")
         return
+    now = time.time()
+    scratch = Bucket()
+    await response.start(200, "application/json")
+    for opening, period, count in ((b'{"hours":[', HOUR, hours), (b'],"days":[', DAY, days)):
+        start = now - now % period
+        separator = ""
+        await response.write(opening)
+        # Newest first; periods with no readings are left out
+        for i in range(count):
+            bucket = rollups.read(period, start - i * period, scratch)
+            if bucket:
+                await response.write((separator + bucket.to_json()).encode())
+                separator = ","
+    await response.write(b"]}")
 
-    machine.RTC().datetime((tm[0], tm[1], tm[2], tm[6] + 1, tm[3], tm[4], tm[5], 0))
+async def serve_power(request, response):
+    # Time spent awake and asleep since boot, or since the last ?reset=1
+    if request.query.get("reset") == "1":
+        power.reset()
+    await response.send(200, "application/json",
+        '{{"low_power":{},"elapsed_ms":{},"awake_ms":{},"asleep_ms":{},"sleeps":{},"skipped":{},"duty_cycle":{:.4f}}}'.format(
+            "true" if LOW_POWER else "false", power.elapsed_ms, power.awake_ms,
+            power.asleep_ms, power.sleeps, power.skipped, power.duty_cycle))
+
+async def serve_delete(request, response):
+    if log is not None:
+        log.clear()
+        await response.send(200, "text/plain", "Log cleared.")
+        return
+    # Check if the file exists
+    try:
+        uos.stat('data.csv')
+    except OSError:
+        await response.send(404, "text/plain", "File not found.")
+        return
+    uos.remove('data.csv')  # Delete the file
+    file_setup()  # Recreate it
+    await response.send(200, "text/plain", "File deleted and new file created.")
+
+# Main setup for the web server
+def setup_web_server():
+    server = WebServer(HTTP_PORT, HTTP_BACKLOG, HTTP_MAX_CLIENTS, HTTP_CHUNK_SIZE)
+    server.route("/", serve_index)
+    server.route("/data.csv", serve_data_csv)
+    server.route("/data", serve_data)
+    server.route("/stats", serve_stats)
+    server.route("/power", serve_power)
+    server.route("/delete", serve_delete)
+    return server
+
+def can_sleep():
+    # Light sleep stops the event loop, and on the Pico W can drop the WiFi
+    # association, so only while the radio is idle between connection
+    # attempts and nothing is being served or pushed
+    return (wifi.state == DISCONNECTED and not server.connections
+            and not (telemetry and telemetry.pushing))
 
 def light_controller():
+    # Only touch the bus when the backlight actually needs to change
     if (potentiometer.read_u16() < 32000):
-        lcd.backlight_off()
-    else:
+        if lcd.backlight:
+            lcd.backlight_off()
+    elif not lcd.backlight:
         lcd.backlight_on()
+
+def dark():
+    # In LOW_POWER mode, turning the backlight off with the potentiometer
+    # turns the ring off too, and the Pico sleeps between readings
+    return LOW_POWER and not lcd.backlight
         
-def display_date():
-    led.on()
-    set_time()
-    lcd.move_to(6, 0) 
-    lcd.putstr("Date")
-    lcd.move_to(4, 1)
-    lcd.putstr(str(time.localtime()[2]) + "-" + str(time.localtime()[1]) + "-" + str(time.localtime()[0]))
-    time.sleep(2)
-    lcd.clear()
-    led.off()
+def on_time_sync(error):
+    global date_shown, lowtemp, hightemp
+    # Show the date once the clock has first been set
+    if not date_shown:
+        date_shown = True
+        # Carry on with today's low and high from before a reset
+        now = time.time()
+        today = rollups.read(DAY, now - now % DAY)
+        if today and tempnow is not None:
+            lowtemp = min(lowtemp, round(today.t_min / 100, 1))
+            hightemp = max(hightemp, round(today.t_max / 100, 1))
+            display.set_readings(tempnow, lowtemp, hightemp, LEDindex)
+        now = time.localtime()
+        show_message(("      Date", "    " + str(now[2]) + "-" + str(now[1]) + "-" + str(now[0])), 2000)
     
-def write_data():
+def write_data(now, temperature, humidity):
     global lastLine
-    file=open("data.csv","a+")
-    if (lastLine is not None and lastLine != "" and lastLine != "{}-{}-{}".format(yearstring, monthstring, daystring)
-                  + "," + "{}:{}:{}".format(hourstring, minutestring, secondstring)):
-        file.write("{}-{}-{}".format(yearstring, monthstring, daystring)
-                  + "," + "{}:{}:{}".format(hourstring, minutestring, secondstring) + ","
-                  + str(round(measurements['t'],2)) + "," + str(humidity) + "\n")
-        file.flush()
-        lastLine = "{}-{}-{}".format(yearstring, monthstring, daystring) + "," + "{}:{}:{}".format(hourstring, minutestring, secondstring)
+    stamp = format_stamp(now)
+    if (lastLine != stamp):
+        if log is not None:
+            log.append(time.mktime(now), temperature, humidity)
+        else:
+            file=open("data.csv","a+")
+            file.write(stamp + "," + str(round(temperature,2)) + "," + str(round(humidity,1)) + "\n")
+            file.flush()
+            file.close()
+        lastLine = stamp
         print("")
         print("-------------------")
         print("Information written")
         print("-------------------")
         print("")
-    file.close()
 
-# Initial setup for main code
-file_setup()
-ip = connect()
-display_date()
-connection = setup_web_server()
+class Period:
+    # Fixed-rate timer for a task loop. wait() sleeps until the next multiple
+    # of the period, so a task's own run time does not stretch its period.
+    # If a task falls more than a period behind it starts again from now
+    # rather than running several times back to back to catch up.
+    def __init__(self, period_ms):
+        self.period_ms = period_ms
+        self.deadline = time.ticks_ms()
 
-# For future additions
-# connection = open_socket(ip)
-print("firstLine = " + firstLine)
-print("lastLine = " + lastLine)
+    async def wait(self):
+        self.deadline = time.ticks_add(self.deadline, self.period_ms)
+        delay = time.ticks_diff(self.deadline, time.ticks_ms())
+        if delay < 0:
+            self.deadline = time.ticks_ms()
+            delay = 0
+        await asyncio.sleep_ms(delay)
 
-# The code
-while True:
-    light_controller()
-    start_web_server(connection)
+    def remaining_ms(self):
+        # Time left until the next wait() is due to end
+        return time.ticks_diff(time.ticks_add(self.deadline, self.period_ms), time.ticks_ms())
+
+def update_readings():
+    global tempnow, lowtemp, hightemp, humidity, LEDindex
+    # Create variable for current temp
+    tempnow = round(sensor.t,1)
+    humidity = round(sensor.rh, 1)
+
+    # If the lowest temp is HIGHER than current temp
+    if lowtemp is None or tempnow < lowtemp:
+        
+         # Update the lowest recorded temp
+        lowtemp = tempnow
     
-    # Create a rounded variable for the temperature and humidity
-    temperature = round(measurements['t'] * 2) / 2
-    humidity = round(measurements['rh'], 1)
+    # If the highest temp is LOWER than current temp
+    if hightemp is None or tempnow > hightemp:
+        
+        # Update the highest recorded temp
+        hightemp = tempnow
+
+    # Find the step on the scale from the filtered reading
+    centi = sensor.t_centi
     
-    if temperature < IDEAL_TEMP - 5:
-        temperature = IDEAL_TEMP - 5
+    if centi < scale.min_centi:
         print("*** Temperature very low ***")
     
-    elif temperature > IDEAL_TEMP + 5:
-        temperature = IDEAL_TEMP + 5
+    elif centi > scale.max_centi:
         print("*** Temperature very high ***")
     
-    LEDindex = (LEDdict[temperature])
+    LEDindex = scale.step(centi)
+    display.set_readings(tempnow, lowtemp, hightemp, LEDindex)
 
-    hour = time.localtime()[3]
-    minute = time.localtime()[4]
-    second = time.localtime()[5]
-    
-    yearstring = str("{:04d}".format(time.localtime()[0]))
-    monthstring = str("{:02d}".format(time.localtime()[1]))
-    daystring = str("{:02d}".format(time.localtime()[2]))
-    hourstring = str("{:02d}".format(hour))
-    minutestring = str("{:02d}".format(minute))
-    secondstring = str("{:02d}".format(second))
-    
-    if (0 <= second < 10 or 20 <= second < 30 or 40 <= second < 50):
-        # Grab data from the sensor dictionary
-        measurements = dht20.measurements
-        
-        # Create variable for current temp
-        tempnow = round(measurements['t'],1)
-
-        # Write initial low temp value to LCD
-        if ((second == 0 or second == 20 or second == 40) and display != "temp"):
-            display = "temp"
-            lcd.clear()
-            lcd.putstr("Current:")
-            lcd.move_to(0, 1) # Move to second row
-            lcd.putstr("L:       H:")
-            lcd.move_to(3, 1)
-            lcd.putstr(str(lowtemp))
-
-            # Write initial high temp value to LCD
-            lcd.move_to(12, 1) # 12th column, 2nd row
-            lcd.putstr(str(hightemp))
-        
-            # Update current temp on display
-            lcd.move_to(12, 0)
-            lcd.putstr(str(tempnow))
-    
-        # If the lowest temp is HIGHER than current temp
-        if tempnow < lowtemp:
-            
-             # Update the lowest recorded temp
-            lowtemp = tempnow
-        
-        # If the highest temp is LOWER than current temp
-        if tempnow > hightemp:
-            
-            # Update the highest recorded temp
-            hightemp = tempnow
-    
+async def sensor_task():
+    # Samples at a fixed rate. The conversion is awaited rather than slept
+    # through, so the other tasks keep running while the sensor works.
+    # Rejected samples leave the filtered values as they were, as does a
+    # missing or faulty sensor, which is tried again next period.
+    period = Period(SENSOR_PERIOD_MS)
+    while True:
+        ready = False
+        try:
+            # Held only for each transfer (the LCD's are a few hundred µs at most)
+            with bus_lock:
+                if not dht20.initialized:
+                    dht20.begin()
+                dht20.start_measurement()
+            await asyncio.sleep_ms(DHT20_CONVERSION_MS)
+            for poll in range(SENSOR_READ_POLLS):
+                with bus_lock:
+                    ready = dht20.read_into(reading)
+                if ready:
+                    break
+                await asyncio.sleep_ms(10)
+        except (OSError, RuntimeError) as e:
+            # Probed again next period, in case it was unplugged and back
+            print("DHT20: " + str(e))
+            dht20.initialized = False
+        if ready and sensor.add(reading):
+            update_readings()
+            # Readings before the clock is set would land in the wrong hour
+            if time_sync.synced:
+                rollups.add(time.time(), sensor.t, sensor.rh)
+        # With nothing on show the whole Pico sleeps until the next reading
+        # or scheduled event is due. The potentiometer is checked on waking.
+        # Light sleep would stop the second core too, so not in DUAL_CORE.
+        if dark() and not DUAL_CORE:
+            if can_sleep():
+                power.sleep(min(period.remaining_ms(), scheduler.time_until_next() * 1000))
+            else:
+                power.skip()
+        await period.wait()
+
+def render_lcd(view):
+    # Alternates between the temperature and the time every 10 seconds.
+    # Only the digits which changed since the last frame are sent.
+    now = time.localtime()
+    second = now[5]
+    if view.message and time.ticks_diff(view.message_until, time.ticks_ms()) > 0:
+        screen.render(view.message)
+    elif (0 <= second < 10 or 20 <= second < 30 or 40 <= second < 50):
+        if view.tempnow is None:
+            screen.render(("   No reading", "  from sensor"))
+        else:
+            screen.render(("Current:    " + str(view.tempnow),
+                           "L: {:<6}H: {}".format(view.lowtemp, view.hightemp)))
     else:
-        if (second == 10 or second == 30 or second == 50):
-            lcd.clear()
-        display = "time"
-        lcd.move_to(6, 0) 
-        lcd.putstr("Time")
-        lcd.move_to(4, 1)
-        lcd.putstr(hourstring + ":" + minutestring + ":" + secondstring)
-    
-    # Print the temperature and index for debugging
-    # print(f"Current time: {hourstring}:{minutestring}:{secondstring}")
-    # print("Temperature:",round(measurements['t'],2))
-    # print("Rounded temp:", temperature)
-    # print(f"Humidity:    {humidity}%")
-    # print("----------------")
-            
-    # Clear the ring
-    ring.fill((0,0,0))
-    ring.write()
-    
-    # Write the info to data.csv every half hour
-    if (minute % 30 == 0 and second == 0):
-        write_data()
-    
-    # Manage the logic for on the hour every hour
-    if (minute == 0 and second == 0):
-        
-        # If it is midnight, reset the low and high temps
-        if (hour == 0):
-            lcd.putstr("Current:")
-            lcd.move_to(0, 1)
-            lcd.putstr("L:       H:")
-            lowtemp = round(measurements['t'],1)
-            hightemp = round(measurements['t'],1)
-            
-        # If it is midnight or midday, set the LED to spin
-        if (hour % 12 == 0):
-            for i in range(12):
-                for i in range(12):
-                    ring.fill((0,0,0))
-                    ring.write()
-                    ring[i] = LEDcolours[LEDindex]
-                    ring.write()
-                    time.sleep(0.05)
-                    ring.fill((0,0,0))
-                    ring.write()
-        
-        # Helpful for managing Daylight Savings
-        if (hour == 3):
-            machine.reset()
-
-        # Otherwise, pulse the amount for the current hour            
-        for i in range(hour % 12):
-            ring.fill(LEDcolours[LEDindex])
-            ring.write()
-            time.sleep(0.3)
-            ring.fill((0,0,0))
-            ring.write()
-            time.sleep(0.8)    
-    
-    # Light the LED dependent on temperature
-    ring[(LEDindex - 4) % 12] = LEDcolours[LEDindex]
-    ring.write()
-    
-    time.sleep(0.4)
+        # The clock carries on from the RTC while offline
+        screen.render(("      Time" if view.online else "  Time offline",
+                       "    {:02d}:{:02d}:{:02d}".format(now[3], now[4], second)))
+
+def chime_animation(hour, index):
+    # In the colour of the temperature shown
+    colour = scale.colours[index]
+    # If it is midnight or midday, set the LED to spin
+    if (hour % 12 == 0):
+        return animator.spiral(colour)
+    # Otherwise, pulse the amount for the current hour
+    return animator.pulse(colour, hour % 12)
+
+async def lcd_task():
+    period = Period(LCD_PERIOD_MS)
+    while True:
+        # The LCD is left as it is while dark; only changes are sent later
+        if not dark():
+            render_lcd(display)
+        await period.wait()
+
+async def led_task():
+    # Shows the temperature on the ring and plays the hourly chimes. The
+    # chime frames are precomputed and awaited between, so sampling and the
+    # web server carry on meanwhile, with the temperature shown on top.
+    period = Period(LED_PERIOD_MS)
+    while True:
+        index = display.led_index
+        hour = display.take_chime()
+        if dark():
+            # Chimes due while dark are dropped
+            animator.set_overlay(-1, None)
+            hour = -1
+        elif display.tempnow is None:
+            # Nothing to show until the sensor gives a reading
+            animator.set_overlay(-1, None)
+        else:
+            animator.set_overlay(scale.positions[index], scale.colours[index])
+        if hour >= 0:
+            await animator.play(chime_animation(hour, index))
+        else:
+            # Only written when something has changed
+            animator.show()
+        await period.wait()
+
+def core1_loop():
+    # In DUAL_CORE mode the second core draws the LCD and the ring and
+    # follows the potentiometer, from a copy of the display state taken
+    # each frame. A chime is stepped through a frame at a time in between,
+    # so the clock keeps going while it plays.
+    view = DisplayState()
+    chime = None
+    frame_due = time.ticks_ms()
+    lcd_due = frame_due
+    while True:
+        now = time.ticks_ms()
+        if time.ticks_diff(lcd_due, now) <= 0:
+            display.copy_into(view)
+            with bus_lock:
+                light_controller()
+                render_lcd(view)
+            if view.tempnow is None:
+                animator.set_overlay(-1, None)
+            else:
+                animator.set_overlay(scale.positions[view.led_index], scale.colours[view.led_index])
+            if chime is None:
+                hour = display.take_chime()
+                if hour >= 0:
+                    chime = animator.frames(chime_animation(hour, view.led_index))
+                    frame_due = now
+                else:
+                    animator.show()
+            lcd_due = time.ticks_add(lcd_due, LCD_PERIOD_MS)
+            # Start again from now rather than catching up
+            if time.ticks_diff(lcd_due, now) < 0:
+                lcd_due = time.ticks_add(now, LCD_PERIOD_MS)
+        if chime is not None and time.ticks_diff(frame_due, now) <= 0:
+            try:
+                frame_due = time.ticks_add(now, next(chime))
+            except StopIteration:
+                chime = None
+        delay = time.ticks_diff(lcd_due, time.ticks_ms())
+        if chime is not None:
+            delay = min(delay, time.ticks_diff(frame_due, time.ticks_ms()))
+        if delay > 0:
+            time.sleep_ms(delay)
+
+def on_log(due, lateness):
+    # The RTC starts from a fixed date at power up, so nothing is logged
+    # until it has been set at least once, nor before there is a reading
+    if not time_sync.synced or not sensor.accepted:
+        return
+    # The rollups in progress are saved along with the log
+    rollups.save()
+    # The mean of every sample since the last entry, stamped with the time
+    # it was due, even if it ran late
+    mean_t, mean_rh = sensor.take_mean()
+    write_data(time.localtime(due), mean_t, mean_rh)
+
+def on_hour(due, lateness):
+    # A chime that is badly late is dropped rather than played out of time
+    if lateness < 60:
+        display.chime(time.localtime(due)[3])
+
+def on_midnight(due, lateness):
+    global lowtemp, hightemp
+    # Reset the low and high temps
+    lowtemp = tempnow
+    hightemp = tempnow
+    display.set_readings(tempnow, lowtemp, hightemp, LEDindex)
+
+def on_clock_step(seconds):
+    # Large jumps (the first sync, daylight saving changes) start the
+    # schedule again from the new time rather than firing events to catch up.
+    # So do the small steps back from drift corrections, which the scheduler
+    # knows not to fire the occurrence that has just fired again for.
+    if scheduler and (seconds < 0 or seconds > 60):
+        scheduler.reschedule()
+
+def on_telemetry(due, lateness):
+    if time_sync.synced and sensor.accepted:
+        telemetry.record(due, sensor.t, sensor.rh)
+
+def setup_telemetry():
+    # Readings wait in an outbox on flash until the collector acknowledges them
+    if not TELEMETRY_HOST:
+        return None
+    outbox = RingLog(TELEMETRY_OUTBOX_PATH, TELEMETRY_OUTBOX_CAPACITY)
+    return Telemetry(TELEMETRY_HOST, TELEMETRY_PORT, DEVICE_ID, outbox,
+                     TELEMETRY_BATCH_SIZE, online=lambda: wifi.connected)
+
+def setup_scheduler():
+    # Events fire once per occurrence from deadlines computed from the RTC,
+    # so a slow web request or animation can no longer make one be missed
+    scheduler = Scheduler()
+    scheduler.every("log", LOG_INTERVAL_S, on_log)
+    scheduler.every("chime", 3600, on_hour)
+    scheduler.every("midnight", 86400, on_midnight)
+    if telemetry:
+        scheduler.every("telemetry", TELEMETRY_INTERVAL_S, on_telemetry)
+    return scheduler
+
+async def backlight_task():
+    period = Period(BACKLIGHT_PERIOD_MS)
+    while True:
+        light_controller()
+        await period.wait()
+
+async def main(server, scheduler, time_sync, wifi, telemetry):
+    # Each subsystem runs as its own task with its own period, so a slow
+    # step in one of them no longer holds up the rest. The web server
+    # handles each client in a task of its own.
+    await server.start()
+    tasks = [
+        sensor_task(),
+        scheduler.run(),
+        time_sync.run(),
+        wifi.run(),
+    ]
+    if DUAL_CORE:
+        # The LCD, ring and backlight are handled by the second core
+        _thread.start_new_thread(core1_loop, ())
+    else:
+        tasks += [lcd_task(), led_task(), backlight_task()]
+    if telemetry:
+        tasks.append(telemetry.run(TELEMETRY_PUSH_S))
+    await asyncio.gather(*tasks)
+
+# Initial setup for main code
+if sensor.accepted:
+    update_readings()
+file_setup()
+# WiFi connects in the background; nothing waits for it
+wifi = WifiManager(SSID, PASSWORD, WIFI_MIN_BACKOFF_MS, WIFI_MAX_BACKOFF_MS, on_change=on_wifi_change)
+time_sync = TimeSync(HOST, NTP_DELTA, UTC_OFFSET_S, DST_ENABLED,
+                     NTP_MIN_INTERVAL_S, NTP_MAX_INTERVAL_S, on_step=on_clock_step,
+                     on_sync=on_time_sync, online=lambda: wifi.connected)
+server = setup_web_server()
+telemetry = setup_telemetry()
+scheduler = setup_scheduler()
+
+print("firstLine = " + firstLine)
+print("lastLine = " + lastLine)
+
+# The code
+asyncio.run(main(server, scheduler, time_sync, wifi, telemetry))
@@ -1,8 +1,14 @@
 # Constants for thermoclock
 NTP_DELTA = 2208988800
 HOST = "pool.ntp.org"
+UTC_OFFSET_S = 0  # Standard time offset from UTC
+DST_ENABLED = True  # EU/UK rules
+NTP_MIN_INTERVAL_S = 3600
+NTP_MAX_INTERVAL_S = 4 * 86400
 SSID = 'HOSTNAME'
 PASSWORD = 'PASSWORD'
+WIFI_MIN_BACKOFF_MS = 1000
+WIFI_MAX_BACKOFF_MS = 300000
 LED_PIN = "LED"
 POTENTIOMETER_PIN = 28
 I2C_INTERFACE = 1
@@ -10,3 +16,74 @@ I2C_SDA_PIN = 14
 I2C_SCL_PIN = 15
 DHT20_ADDRESS = 0x38
 NEOPIXEL_PIN = 2
+LCD_INTERFACE = 1
+LCD_ADDRESS = 0x27
+LCD_ROWS = 2
+LCD_COLUMNS = 16
+NEOPIXEL_LCD_TOTAL = 12
+NEOPIXEL_TOP_LED = 6
+
+# Temperature scale on the ring: IDEAL_TEMP +/- TEMP_SCALE_SPAN in steps of
+# TEMP_SCALE_RESOLUTION, coloured from blue, to green, to red
+TEMP_SCALE_SPAN = 5
+TEMP_SCALE_RESOLUTION = 0.5
+TEMP_SCALE_GRADIENT = ((0,0,10), (0,10,0), (10,0,0))
+
+# Sensor filtering: the median of the last SENSOR_FILTER_SIZE samples,
+# smoothed by a moving average; samples more than SENSOR_MAX_STEP (°C or
+# %RH) from the median are dropped as outliers
+SENSOR_FILTER_SIZE = 5
+SENSOR_EMA_ALPHA = 0.2
+SENSOR_MAX_STEP = 1.0
+
+# Attempts at a first reading before starting without one, and how many
+# times (10 ms apart) a conversion is checked for before giving up on it
+SENSOR_BOOT_ATTEMPTS = 10
+SENSOR_READ_POLLS = 10
+
+# Task periods (ms)
+SENSOR_PERIOD_MS = 1000
+DHT20_CONVERSION_MS = 80
+LCD_PERIOD_MS = 200
+LED_PERIOD_MS = 200
+BACKLIGHT_PERIOD_MS = 200
+
+# Draw the LCD and the ring from the RP2040's second core, leaving the
+# first to sampling, logging and the network
+DUAL_CORE = False
+
+# Light sleep between readings while the backlight is turned off (which
+# then turns the ring off too). Not used with DUAL_CORE.
+LOW_POWER = False
+LOW_POWER_MIN_SLEEP_MS = 20
+LOW_POWER_MAX_SLEEP_MS = 1000
+
+# Web server
+HTTP_PORT = 80
+HTTP_BACKLOG = 4
+HTTP_MAX_CLIENTS = 3
+HTTP_CHUNK_SIZE = 512
+
+# Seconds between log entries
+LOG_INTERVAL_S = 1800
+
+# Logging: "csv" appends text lines to data.csv, "ring" keeps fixed-size
+# binary records in a preallocated ring file and only produces CSV on export
+LOG_STORAGE = "csv"
+RING_LOG_PATH = "data.bin"
+RING_LOG_CAPACITY = 17520  # One year of half-hourly readings
+
+# Hourly and daily min/max/mean of the readings, served at /stats
+ROLLUP_PATH = "rollups.bin"
+ROLLUP_HOURS = 48
+ROLLUP_DAYS = 62
+
+# Telemetry push to a collector (see telemetry_collector.py); None disables it
+DEVICE_ID = "thermoclock"
+TELEMETRY_HOST = None
+TELEMETRY_PORT = 5005
+TELEMETRY_INTERVAL_S = 60  # How often a reading is queued
+TELEMETRY_PUSH_S = 300  # How often the outbox is sent
+TELEMETRY_BATCH_SIZE = 50
+TELEMETRY_OUTBOX_PATH = "outbox.bin"
+TELEMETRY_OUTBOX_CAPACITY = 10080  # One week of readings at one a minute
@@ -0,0 +1,70 @@
+import machine
+import time
+
+
+class PowerManager:
+    """Light sleep between events, and a record of time spent awake and asleep.
+
+    The caller decides when nothing needs the CPU and for how long, and
+    sleep() puts the RP2040 into machine.lightsleep() for that time. The
+    timer keeps running in light sleep, so time.ticks_ms() stays correct
+    and the time actually slept is measured rather than assumed. Sleeps too
+    short to be worth the wake up are skipped.
+
+    asleep_ms: total time spent in light sleep,
+    sleeps: the number of light sleeps taken,
+    skipped: the number of sleeps the caller could not take (see skip())
+    """
+
+    def __init__(self, min_sleep_ms: int = 20, max_sleep_ms: int = 1000):
+        """Keyword arguments:
+        min_sleep_ms -- the shortest sleep worth taking
+        max_sleep_ms -- the longest single sleep; inputs are only checked
+                        on waking, so this bounds how long they can wait
+        """
+        self.min_sleep_ms = min_sleep_ms
+        self.max_sleep_ms = max_sleep_ms
+        self.asleep_ms = 0
+        self.sleeps = 0
+        self.skipped = 0
+        self._since = time.ticks_ms()
+
+    @property
+    def elapsed_ms(self) -> int:
+        """Time since the record was started or reset."""
+        return time.ticks_diff(time.ticks_ms(), self._since)
+
+    @property
+    def awake_ms(self) -> int:
+        return self.elapsed_ms - self.asleep_ms
+
+    @property
+    def duty_cycle(self) -> float:
+        """The fraction of the time spent awake."""
+        elapsed = self.elapsed_ms
+        return (elapsed - self.asleep_ms) / elapsed if elapsed > 0 else 1.0
+
+    def reset(self):
+        """Start the record again from now."""
+        self.asleep_ms = 0
+        self.sleeps = 0
+        self.skipped = 0
+        self._since = time.ticks_ms()
+
+    def skip(self):
+        """Record a sleep not taken because something else needed to run."""
+        self.skipped += 1
+
+    def sleep(self, ms: int) -> int:
+        """Light sleep for up to ms milliseconds. Returns the time slept."""
+        ms = min(ms, self.max_sleep_ms)
+
+        if ms < self.min_sleep_ms:
+            return 0
+
+        start = time.ticks_ms()
+        machine.lightsleep(ms)
+        slept = time.ticks_diff(time.ticks_ms(), start)
+        self.asleep_ms += slept
+        self.sleeps += 1
+        return slept
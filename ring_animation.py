@@ -0,0 +1,175 @@
+from array import array
+import uasyncio as asyncio
+
+
+class Animation:
+    """A sequence of frames precomputed into one bytearray.
+
+    Each frame is laid out exactly like the NeoPixel's own buffer (same
+    pixel count, bytes per pixel and colour order), so playing a frame is a
+    straight copy followed by a single write.
+
+    frames: the frame store, frame_size bytes per frame,
+    durations: how long each frame is shown (ms),
+    repeat: how many times the whole sequence is played
+    """
+
+    def __init__(self, count: int, frame_size: int, repeat: int = 1):
+        self.count = count
+        self.frame_size = frame_size
+        self.frames = bytearray(count * frame_size)
+        self.durations = array('H', [0] * count)
+        self.repeat = repeat
+
+
+class RingAnimator:
+    """Builds and plays animations on a NeoPixel ring.
+
+    From a uasyncio task, playback awaits between frames, so sampling and
+    the web server carry on while an animation runs. Elsewhere, frames()
+    can be stepped through directly. An overlay pixel (the temperature indicator)
+    can be composited on top of every frame.
+
+    Colours are (red, green, blue) tuples. On an RGBW ring (bpp 4) the
+    white channel is left off unless a fourth value is given.
+    """
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.count = ring.n
+        self.bpp = ring.bpp
+        self.order = ring.ORDER
+        self.frame_size = self.count * self.bpp
+        self.overlay_index = -1
+        self.overlay = bytearray(self.bpp)
+        self.playing = False
+        self._dirty = True
+        self._cache = {}
+
+    def _pack(self, colour, buffer, offset: int):
+        # Store a colour tuple in the ring's byte order, with any channels
+        # it does not give (white on an RGBW ring) off
+        n = len(colour)
+
+        for i in range(self.bpp):
+            buffer[offset + self.order[i]] = colour[i] if i < n else 0
+
+    def set_pixel(self, animation: Animation, frame: int, index: int, colour):
+        """Set one pixel of one frame."""
+        self._pack(colour, animation.frames, frame * self.frame_size + (index % self.count) * self.bpp)
+
+    def fill(self, animation: Animation, frame: int, colour):
+        """Set every pixel of one frame."""
+        for index in range(self.count):
+            self.set_pixel(animation, frame, index, colour)
+
+    def spiral(self, colour, turns: int = 12, step_ms: int = 50) -> Animation:
+        """A single light spinning around the ring."""
+        key = ("spiral", colour, turns, step_ms)
+
+        if key not in self._cache:
+            animation = Animation(self.count, self.frame_size, turns)
+
+            for frame in range(self.count):
+                self.set_pixel(animation, frame, frame, colour)
+                animation.durations[frame] = step_ms
+
+            self._cache[key] = animation
+
+        return self._cache[key]
+
+    def pulse(self, colour, times: int, on_ms: int = 300, off_ms: int = 800) -> Animation:
+        """The whole ring flashing a number of times."""
+        key = ("pulse", colour, on_ms, off_ms)
+
+        if key not in self._cache:
+            animation = Animation(2, self.frame_size)
+            self.fill(animation, 0, colour)
+            animation.durations[0] = on_ms
+            animation.durations[1] = off_ms
+            self._cache[key] = animation
+
+        animation = self._cache[key]
+        animation.repeat = times
+        return animation
+
+    def forget(self):
+        """Drop cached animations, e.g. when the colours in use have changed."""
+        self._cache = {}
+
+    def set_overlay(self, index: int, colour):
+        """Set the pixel drawn on top of every frame, or pass index -1 for none."""
+        changed = index != self.overlay_index
+        self.overlay_index = index
+
+        if index >= 0:
+            n = len(colour)
+
+            for i in range(self.bpp):
+                position = self.order[i]
+                value = colour[i] if i < n else 0
+
+                if self.overlay[position] != value:
+                    self.overlay[position] = value
+                    changed = True
+
+        if changed:
+            self._dirty = True
+
+    def _draw_overlay(self):
+        if self.overlay_index >= 0:
+            offset = (self.overlay_index % self.count) * self.bpp
+            self.ring.buf[offset:offset + self.bpp] = self.overlay
+
+    def show(self):
+        """Write a blank ring with just the overlay pixel.
+
+        Nothing is written if the ring already shows exactly that.
+        """
+        if not self._dirty:
+            return
+
+        self._dirty = False
+        buffer = self.ring.buf
+
+        for i in range(len(buffer)):
+            buffer[i] = 0
+
+        self._draw_overlay()
+        self.ring.write()
+
+    def frames(self, animation: Animation, overlay: bool = True):
+        """Write each frame of an animation to the ring in turn.
+
+        A generator: after each frame it yields how long (ms) the frame is
+        to be shown, and the caller waits that long before asking for the
+        next. The ring is left showing just the overlay at the end.
+
+        Keyword arguments:
+        animation -- the animation to play
+        overlay -- whether to composite the overlay pixel on top
+        """
+        frames = memoryview(animation.frames)
+        size = animation.frame_size
+        buffer = self.ring.buf
+        self.playing = True
+        self._dirty = True
+
+        try:
+            for _ in range(animation.repeat):
+                for frame in range(animation.count):
+                    buffer[:] = frames[frame * size:(frame + 1) * size]
+
+                    if overlay:
+                        self._draw_overlay()
+
+                    self.ring.write()
+                    yield animation.durations[frame]
+        finally:
+            self.playing = False
+            self.show()
+
+    async def play(self, animation: Animation, overlay: bool = True):
+        """Play an animation, writing each frame to the ring exactly once."""
+        for ms in self.frames(animation, overlay):
+            await asyncio.sleep_ms(ms)
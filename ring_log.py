@@ -0,0 +1,199 @@
+import struct
+import time
+
+# Header: magic, version, record size, capacity, first sequence, next sequence
+HEADER_FORMAT = "<4sHHIII"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b"TCRL"
+VERSION = 1
+
+# Record: timestamp (s), temperature (0.01 °C), relative humidity (0.01 %)
+RECORD_FORMAT = "<IhH"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+CSV_HEADER = "Date,Time,Temperature,Humidity\n"
+
+
+class RingLog:
+    """Fixed-size binary log of readings, kept in a preallocated ring file.
+
+    Every record has the same packed size, so appending is a single seek and
+    write, and the file never grows once created. When the ring is full the
+    oldest record is overwritten. The header holds the sequence numbers of
+    the oldest and next records; record n lives in slot n % capacity.
+    Sequence numbers keep increasing across wraps and clear(), so they can
+    be used as cursors by clients syncing incrementally. They only start
+    again from 0 if the file is created afresh, which sets created.
+
+    CSV is only produced on export, see read_csv_into().
+    """
+
+    def __init__(self, path: str, capacity: int):
+        """Open the log, creating and preallocating it if necessary.
+
+        An existing log keeps the capacity it was created with.
+
+        Keyword arguments:
+        path -- the file to store the log in
+        capacity -- the number of records to hold before wrapping
+        """
+        self.path = path
+        self.created = False
+        self._record = bytearray(RECORD_SIZE)
+        self._header = bytearray(HEADER_SIZE)
+
+        try:
+            self._file = open(path, "r+b")
+            self._read_header()
+        except (OSError, ValueError):
+            self._create(capacity)
+
+    def _create(self, capacity: int):
+        self._file = open(self.path, "w+b")
+        self.created = True
+        self.capacity = capacity
+        self.first = 0
+        self.next = 0
+        self._write_header()
+
+        # Preallocate the whole ring up front
+        block = bytearray(RECORD_SIZE * 32)
+        remaining = capacity * RECORD_SIZE
+
+        while remaining > 0:
+            n = min(remaining, len(block))
+            self._file.write(block if n == len(block) else block[:n])
+            remaining -= n
+
+        self._file.flush()
+
+    def _read_header(self):
+        self._file.seek(0)
+
+        if self._file.readinto(self._header) != HEADER_SIZE:
+            raise ValueError("Truncated ring log header.")
+
+        magic, version, record_size, capacity, first, next_seq = struct.unpack(HEADER_FORMAT, self._header)
+
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE or not capacity:
+            raise ValueError("Not a ring log.")
+
+        self.capacity = capacity
+        self.first = first
+        self.next = next_seq
+
+    def _write_header(self):
+        struct.pack_into(HEADER_FORMAT, self._header, 0,
+                         MAGIC, VERSION, RECORD_SIZE, self.capacity, self.first, self.next)
+        self._file.seek(0)
+        self._file.write(self._header)
+
+    def __len__(self) -> int:
+        return self.next - self.first
+
+    def append(self, timestamp: int, temperature: float, humidity: float):
+        """Add a reading, overwriting the oldest one if the ring is full.
+
+        Keyword arguments:
+        timestamp -- seconds since the epoch, as returned by time.mktime()
+        temperature -- the temperature (°C)
+        humidity -- the relative humidity (%RH)
+        """
+        struct.pack_into(RECORD_FORMAT, self._record, 0,
+                         timestamp, round(temperature * 100), round(humidity * 100))
+        self._file.seek(HEADER_SIZE + (self.next % self.capacity) * RECORD_SIZE)
+        self._file.write(self._record)
+
+        # The record is written before the header, so a reset part way
+        # through loses at most the new record
+        self.next += 1
+
+        if self.next - self.first > self.capacity:
+            self.first = self.next - self.capacity
+
+        self._write_header()
+        self._file.flush()
+
+    def read(self, seq: int) -> tuple:
+        """Return (timestamp, temperature, humidity) for a sequence number."""
+        if not self.first <= seq < self.next:
+            raise IndexError("Record is not in the log.")
+
+        self._file.seek(HEADER_SIZE + (seq % self.capacity) * RECORD_SIZE)
+        self._file.readinto(self._record)
+        timestamp, temperature, humidity = struct.unpack(RECORD_FORMAT, self._record)
+        return timestamp, temperature / 100, humidity / 100
+
+    def last(self):
+        """Return the most recent record, or None if the log is empty."""
+        if self.next == self.first:
+            return None
+
+        return self.read(self.next - 1)
+
+    def find_after(self, timestamp: int) -> int:
+        """Return the sequence number of the first record later than a timestamp.
+
+        Records are appended in time order, so this is a binary search.
+        """
+        lo = self.first
+        hi = self.next
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+
+            if self.read(mid)[0] > timestamp:
+                hi = mid
+            else:
+                lo = mid + 1
+
+        return lo
+
+    def discard_before(self, seq: int):
+        """Discard every record older than a sequence number."""
+        seq = min(seq, self.next)
+
+        if seq > self.first:
+            self.first = seq
+            self._write_header()
+            self._file.flush()
+
+    def clear(self):
+        """Discard every record. Sequence numbers carry on from where they were."""
+        self.first = self.next
+        self._write_header()
+        self._file.flush()
+
+    def read_csv_into(self, seq: int, buffer: bytearray, end: int = None) -> tuple:
+        """Format records as CSV lines into a buffer, starting from a sequence number.
+
+        Returns (bytes written, next sequence number). Stops when the buffer
+        cannot fit another line or the log is exhausted, so calling again
+        with the returned sequence number continues the export.
+
+        Keyword arguments:
+        seq -- the first record to export; older records are skipped
+        buffer -- where to put the CSV lines
+        end -- the sequence number to stop at, or None for the newest record
+        """
+        seq = max(seq, self.first)
+        end = self.next if end is None else min(end, self.next)
+        size = 0
+
+        while seq < end:
+            timestamp, temperature, humidity = self.read(seq)
+            tm = time.localtime(timestamp)
+            line = "{:04d}-{:02d}-{:02d},{:02d}:{:02d}:{:02d},{},{}\n".format(
+                tm[0], tm[1], tm[2], tm[3], tm[4], tm[5], temperature, humidity).encode()
+
+            if size + len(line) > len(buffer):
+                break
+
+            buffer[size:size + len(line)] = line
+            size += len(line)
+            seq += 1
+
+        return size, seq
+
+    def close(self):
+        self._file.close()
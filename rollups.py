@@ -0,0 +1,207 @@
+import struct
+import time
+
+# Header: magic, version, bucket size, hourly capacity, daily capacity
+HEADER_FORMAT = "<4sHHHH"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b"TCRU"
+VERSION = 1
+
+# Bucket: start (s), count, then the minimum, maximum and sum of the
+# temperature (0.01 °C) and of the relative humidity (0.01 %)
+BUCKET_FORMAT = "<IIhhqHHQ"
+BUCKET_SIZE = struct.calcsize(BUCKET_FORMAT)
+
+HOUR = 3600
+DAY = 86400
+
+
+class Bucket:
+    """Running aggregates for one hour or day. Values are kept in hundredths."""
+    __slots__ = ("start", "count", "t_min", "t_max", "t_sum", "rh_min", "rh_max", "rh_sum")
+
+    def __init__(self, start: int = 0):
+        self.reset(start)
+
+    def reset(self, start: int):
+        self.start = start
+        self.count = 0
+        self.t_min = 0
+        self.t_max = 0
+        self.t_sum = 0
+        self.rh_min = 0
+        self.rh_max = 0
+        self.rh_sum = 0
+
+    def add(self, t: int, rh: int):
+        if self.count:
+            self.t_min = min(self.t_min, t)
+            self.t_max = max(self.t_max, t)
+            self.rh_min = min(self.rh_min, rh)
+            self.rh_max = max(self.rh_max, rh)
+        else:
+            self.t_min = self.t_max = t
+            self.rh_min = self.rh_max = rh
+
+        self.count += 1
+        self.t_sum += t
+        self.rh_sum += rh
+
+    def to_json(self) -> str:
+        tm = time.localtime(self.start)
+        return ('{{"start":"{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}","count":{},'
+                '"t_min":{},"t_max":{},"t_mean":{},"rh_min":{},"rh_max":{},"rh_mean":{}}}').format(
+            tm[0], tm[1], tm[2], tm[3], tm[4], tm[5], self.count,
+            self.t_min / 100, self.t_max / 100, round(self.t_sum / self.count) / 100,
+            self.rh_min / 100, self.rh_max / 100, round(self.rh_sum / self.count) / 100)
+
+    def pack_into(self, buffer: bytearray):
+        struct.pack_into(BUCKET_FORMAT, buffer, 0, self.start, self.count, self.t_min, self.t_max,
+                         self.t_sum, self.rh_min, self.rh_max, self.rh_sum)
+
+    def unpack_from(self, buffer: bytearray):
+        (self.start, self.count, self.t_min, self.t_max,
+         self.t_sum, self.rh_min, self.rh_max, self.rh_sum) = struct.unpack(BUCKET_FORMAT, buffer)
+
+
+class Rollups:
+    """Hourly and daily minimum, maximum and mean of the readings, kept on flash.
+
+    Each reading updates the current hour's and day's buckets in memory in
+    constant time. The buckets live in two fixed rings in a preallocated
+    file, the bucket starting at time s in slot (s // period) % capacity,
+    so the file never grows and old buckets are simply overwritten. A
+    bucket is written out when its period ends and whenever save() is
+    called, so a reset loses at most the readings since the last save.
+
+    Times are local, as kept by the RTC.
+    """
+
+    def __init__(self, path: str, hours: int = 48, days: int = 62):
+        """Open the rollups, creating and preallocating the file if necessary.
+
+        Existing rollups are discarded if the capacities have changed.
+
+        Keyword arguments:
+        path -- the file to store the rollups in
+        hours -- the number of hourly buckets to keep
+        days -- the number of daily buckets to keep
+        """
+        self.path = path
+        self.hours = hours
+        self.days = days
+        self.hour = Bucket()
+        self.day = Bucket()
+        self._scratch = Bucket()
+        self._buffer = bytearray(max(HEADER_SIZE, BUCKET_SIZE))
+        self._record = memoryview(self._buffer)[:BUCKET_SIZE]
+
+        try:
+            self._file = open(path, "r+b")
+            self._check_header()
+        except (OSError, ValueError):
+            self._create()
+
+    def _create(self):
+        self._file = open(self.path, "w+b")
+        struct.pack_into(HEADER_FORMAT, self._buffer, 0, MAGIC, VERSION, BUCKET_SIZE, self.hours, self.days)
+        self._file.write(memoryview(self._buffer)[:HEADER_SIZE])
+
+        # Preallocate both rings; a zero start marks an empty slot
+        empty = bytearray(BUCKET_SIZE)
+
+        for _ in range(self.hours + self.days):
+            self._file.write(empty)
+
+        self._file.flush()
+
+    def _check_header(self):
+        header = self._file.read(HEADER_SIZE)
+
+        if len(header) != HEADER_SIZE:
+            raise ValueError("Truncated rollup header.")
+
+        if struct.unpack(HEADER_FORMAT, header) != (MAGIC, VERSION, BUCKET_SIZE, self.hours, self.days):
+            raise ValueError("Not a rollup file, or a different layout.")
+
+    def _offset(self, period: int, start: int) -> int:
+        if period == HOUR:
+            return HEADER_SIZE + (start // HOUR) % self.hours * BUCKET_SIZE
+
+        return HEADER_SIZE + (self.hours + (start // DAY) % self.days) * BUCKET_SIZE
+
+    def _write(self, period: int, bucket: Bucket):
+        bucket.pack_into(self._record)
+        self._file.seek(self._offset(period, bucket.start))
+        self._file.write(self._record)
+
+    def read(self, period: int, start: int, bucket: Bucket = None) -> Bucket:
+        """Read the bucket starting at a time into bucket (or a new one).
+
+        Returns None if it is not held, either never filled or overwritten.
+
+        Keyword arguments:
+        period -- HOUR or DAY
+        start -- the start of the hour or day
+        bucket -- where to put it
+        """
+        current = self.hour if period == HOUR else self.day
+
+        if current.count and current.start == start:
+            return current
+
+        self._file.seek(self._offset(period, start))
+        self._file.readinto(self._record)
+        bucket = bucket or Bucket()
+        bucket.unpack_from(self._record)
+
+        if bucket.start != start or not bucket.count:
+            return None
+
+        return bucket
+
+    def _roll(self, period: int, current: Bucket, timestamp: int):
+        start = timestamp - timestamp % period
+
+        if start == current.start:
+            return
+
+        # The period has ended, so its bucket is written out for good
+        if current.count:
+            self._write(period, current)
+            self._file.flush()
+
+        # Carry on with what was saved for this period before a reset
+        if self.read(period, start, self._scratch):
+            current.unpack_from(self._record)
+        else:
+            current.reset(start)
+
+    def add(self, timestamp: int, temperature: float, humidity: float):
+        """Add a reading to the current hour and day.
+
+        Keyword arguments:
+        timestamp -- local seconds since the epoch, as returned by time.time()
+        temperature -- the temperature (°C)
+        humidity -- the relative humidity (%RH)
+        """
+        self._roll(HOUR, self.hour, timestamp)
+        self._roll(DAY, self.day, timestamp)
+        t = round(temperature * 100)
+        rh = round(humidity * 100)
+        self.hour.add(t, rh)
+        self.day.add(t, rh)
+
+    def save(self):
+        """Write out the buckets still being filled."""
+        if self.hour.count:
+            self._write(HOUR, self.hour)
+
+        if self.day.count:
+            self._write(DAY, self.day)
+
+        self._file.flush()
+
+    def close(self):
+        self.save()
+        self._file.close()
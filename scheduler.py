@@ -0,0 +1,136 @@
+import time
+import uasyncio as asyncio
+
+# Longest the scheduler sleeps in one go, so that a change to the RTC (e.g.
+# an NTP sync) is noticed reasonably quickly
+MAX_SLEEP_S = 60
+
+
+class RecurringEvent:
+    """An event which recurs every interval seconds, offset seconds after
+    each multiple of the interval (counted from the epoch, in RTC time).
+
+    next_due: the RTC time at which it is next due,
+    last_due: the RTC time it was last due at when it fired, or 0,
+    lateness: how late (s) it fired last time,
+    missed: how many occurrences were skipped last time it fired late
+    """
+
+    __slots__ = ('name', 'interval', 'offset', 'callback', 'next_due', 'last_due', 'lateness',
+                 'missed')
+
+    def __init__(self, name: str, interval: int, offset: int, callback):
+        self.name = name
+        self.interval = interval
+        self.offset = offset
+        self.callback = callback
+        self.next_due = 0
+        self.last_due = 0
+        self.lateness = 0
+        self.missed = 0
+
+    def schedule(self, now: int):
+        """Set next_due to the first occurrence after now.
+
+        If the clock has been stepped back by less than an interval, e.g. a
+        drift correction just after the event fired, that is the occurrence
+        which has just fired, so the one after it is due next instead.
+        """
+        self.next_due = now - (now - self.offset) % self.interval + self.interval
+
+        if self.next_due == self.last_due:
+            self.next_due += self.interval
+
+
+class Scheduler:
+    """Fires recurring events from deadlines computed from the RTC.
+
+    Each event fires exactly once per occurrence it catches, even if the
+    check comes late: a late event fires once with its scheduled time and
+    how late it was, and occurrences skipped entirely (e.g. after a long
+    stall) are counted rather than replayed. Stepping the clock back by less
+    than an interval never makes an occurrence fire again. Between deadlines nothing
+    needs to poll, so run() sleeps until the next one is due.
+    """
+
+    def __init__(self, clock=time.time):
+        """Keyword arguments:
+        clock -- returns the current RTC time in whole seconds
+        """
+        self._clock = clock
+        self._events = []
+
+    def every(self, name: str, interval: int, callback, offset: int = 0) -> RecurringEvent:
+        """Add a recurring event.
+
+        The callback is called as callback(due, lateness), where due is the
+        RTC time the event was scheduled for and lateness is in seconds.
+
+        Keyword arguments:
+        name -- used when reporting lateness
+        interval -- seconds between occurrences, e.g. 1800 for every half hour
+        callback -- the function to call
+        offset -- seconds after each multiple of the interval, e.g. 3 * 3600
+                  with an interval of 86400 for 03:00 every day
+        """
+        event = RecurringEvent(name, interval, offset, callback)
+        event.schedule(self._clock())
+        self._events.append(event)
+        return event
+
+    def reschedule(self):
+        """Recompute every deadline, e.g. after the RTC has been set."""
+        now = self._clock()
+
+        for event in self._events:
+            event.schedule(now)
+
+    def run_pending(self) -> int:
+        """Fire every event that is due. Returns the number fired."""
+        now = self._clock()
+        fired = 0
+
+        for event in self._events:
+            if now < event.next_due - event.interval:
+                # The clock has gone backwards; start again from now
+                event.schedule(now)
+                continue
+
+            if now < event.next_due:
+                continue
+
+            due = event.next_due
+            event.last_due = due
+            event.lateness = now - due
+            event.missed = event.lateness // event.interval
+            event.schedule(now)
+
+            if event.missed:
+                print(f"{event.name} fired {event.lateness} s late, skipping {event.missed}")
+
+            event.callback(due, event.lateness)
+            fired += 1
+
+        return fired
+
+    def time_until_next(self) -> int:
+        """Seconds until the next event is due, capped at MAX_SLEEP_S."""
+        now = self._clock()
+        delay = MAX_SLEEP_S
+
+        for event in self._events:
+            delay = min(delay, event.next_due - now)
+
+        return max(0, delay)
+
+    async def run(self):
+        """Sleep until each deadline and fire the events that are due."""
+        while True:
+            self.run_pending()
+            delay = self.time_until_next()
+
+            if delay:
+                await asyncio.sleep(delay)
+            else:
+                # Due within the current second; check again shortly
+                await asyncio.sleep_ms(100)
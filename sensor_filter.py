@@ -0,0 +1,125 @@
+from array import array
+
+
+class SensorFilter:
+    """Smooths the stream of DHT20 readings taken by the sensor task.
+
+    Samples are kept in hundredths in a small preallocated ring. Readings
+    which fail the CRC check are dropped, as is a sample further than
+    max_step from the median of the ring, unless the ring fills with such
+    samples in a row, in which case the change is real and the ring starts
+    again from it. The median of the ring is then smoothed with an
+    exponential moving average. The mean of every sample accepted since the
+    last take_mean() is kept as well, for logging.
+
+    t, rh: the filtered temperature (°C) and relative humidity (%RH),
+    t_centi: the filtered temperature in hundredths of a degree,
+    accepted, rejected: the number of samples taken and dropped
+    """
+
+    def __init__(self, size: int = 5, alpha: float = 0.2, max_step: float = 1.0):
+        """Keyword arguments:
+        size -- the number of samples the median is taken over
+        alpha -- the weight of each new median in the moving average (0-1]
+        max_step -- how far (°C or %RH) a sample may be from the median
+        """
+        self.size = size
+        self.alpha = alpha
+        self.max_step = round(max_step * 100)
+        self.t = 0.0
+        self.rh = 0.0
+        self.t_centi = 0
+        self.accepted = 0
+        self.rejected = 0
+        self._t = array('h', bytes(2 * size))
+        self._rh = array('h', bytes(2 * size))
+        self._sorted = array('h', bytes(2 * size))
+        self._count = 0
+        self._index = 0
+        self._outliers = 0
+        self._t_ema = None
+        self._rh_ema = None
+        self._t_sum = 0
+        self._rh_sum = 0
+        self._sum_count = 0
+
+    def _median(self, samples: array) -> int:
+        # Insertion sort into a scratch array, so nothing is allocated
+        n = self._count
+        ordered = self._sorted
+
+        for i in range(n):
+            value = samples[i]
+            j = i
+
+            while j and ordered[j - 1] > value:
+                ordered[j] = ordered[j - 1]
+                j -= 1
+
+            ordered[j] = value
+
+        return ordered[n // 2]
+
+    def add(self, reading) -> bool:
+        """Add a DHT20Reading. Returns whether it was accepted."""
+        if not reading.crc_ok:
+            self.rejected += 1
+            return False
+
+        # Rounded hundredths straight from the raw 20-bit values
+        t = ((reading.t_adc * 20000 + (1 << 19)) >> 20) - 5000
+        rh = (reading.rh_adc * 10000 + (1 << 19)) >> 20
+
+        if self._count == self.size:
+            if (abs(t - self._median(self._t)) > self.max_step
+                    or abs(rh - self._median(self._rh)) > self.max_step):
+                self._outliers += 1
+
+                if self._outliers < self.size:
+                    self.rejected += 1
+                    return False
+
+                # A real step change: start again from here
+                self._count = 0
+                self._index = 0
+
+        self._outliers = 0
+        self.accepted += 1
+        self._t[self._index] = t
+        self._rh[self._index] = rh
+        self._index = (self._index + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+        self._t_sum += t
+        self._rh_sum += rh
+        self._sum_count += 1
+
+        t = self._median(self._t)
+        rh = self._median(self._rh)
+
+        if self._t_ema is None or self._count == 1:
+            self._t_ema = t
+            self._rh_ema = rh
+        else:
+            self._t_ema += self.alpha * (t - self._t_ema)
+            self._rh_ema += self.alpha * (rh - self._rh_ema)
+
+        self.t_centi = round(self._t_ema)
+        self.t = self.t_centi / 100
+        self.rh = round(self._rh_ema) / 100
+        return True
+
+    def take_mean(self) -> tuple:
+        """Return the mean (temperature, humidity) of the samples since the last call.
+
+        Falls back to the filtered values if there have been none.
+        """
+        if not self._sum_count:
+            return self.t, self.rh
+
+        t = round(self._t_sum / self._sum_count) / 100
+        rh = round(self._rh_sum / self._sum_count) / 100
+        self._t_sum = 0
+        self._rh_sum = 0
+        self._sum_count = 0
+        return t, rh
@@ -0,0 +1,130 @@
+import random
+import time
+import uasyncio as asyncio
+
+from ring_log import RingLog
+
+# Protocol, one TCP connection per batch:
+#
+#   device -> collector   BATCH <device id> <epoch> <count>\n
+#                         <seq>,<YYYY-MM-DD>,<HH:MM:SS>,<temperature>,<humidity>\n  (count times)
+#   collector -> device   ACK <seq>\n
+#
+# The ACK carries the highest sequence number the collector has stored.
+# Everything up to it is removed from the outbox; anything else is sent
+# again in the next batch. The collector ignores sequence numbers it has
+# already stored, so a lost ACK does not duplicate rows.
+#
+# Sequence numbers start again from 0 whenever the outbox file is created
+# afresh (deleted, resized or the flash reformatted), so each outbox is
+# given a random epoch and the collector keeps its sequence numbers per
+# device and epoch. Otherwise the new readings would be taken for ones
+# already stored, acknowledged and thrown away.
+
+
+class Telemetry:
+    """Store-and-forward push of readings to a collector.
+
+    Readings go into an outbox kept on flash (a RingLog, so it survives
+    resets and has a fixed size) and are pushed in batches whenever the
+    network is up. If the device is offline for longer than the outbox
+    holds, the oldest unsent readings are lost.
+
+    pushing: whether a push is in progress
+    """
+
+    def __init__(self, host: str, port: int, device_id: str, outbox: RingLog,
+                 batch_size: int = 50, timeout_ms: int = 5000, online=None):
+        """Keyword arguments:
+        host -- the collector's address
+        port -- the collector's TCP port
+        device_id -- identifies this device to the collector
+        outbox -- where readings wait until acknowledged
+        batch_size -- the most readings sent per connection
+        timeout_ms -- how long to wait for the collector
+        online -- returns whether the network is up
+        """
+        self.host = host
+        self.port = port
+        self.device_id = device_id
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.timeout_ms = timeout_ms
+        self.online = online
+        self.pushing = False
+        self.epoch = self._load_epoch()
+
+    def _load_epoch(self) -> str:
+        # Kept next to the outbox, and only replaced when the outbox is new
+        path = self.outbox.path + ".epoch"
+
+        if not self.outbox.created:
+            try:
+                with open(path) as f:
+                    epoch = f.read().strip()
+                if epoch:
+                    return epoch
+            except OSError:
+                pass
+
+        epoch = "{:08x}".format(random.getrandbits(32))
+
+        with open(path, "w") as f:
+            f.write(epoch)
+
+        return epoch
+
+    def record(self, timestamp: int, temperature: float, humidity: float):
+        """Queue a reading for the next push."""
+        self.outbox.append(timestamp, temperature, humidity)
+
+    async def _send_batch(self, start: int, end: int) -> int:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+
+        try:
+            writer.write("BATCH {} {} {}\n".format(self.device_id, self.epoch, end - start).encode())
+
+            for seq in range(start, end):
+                timestamp, temperature, humidity = self.outbox.read(seq)
+                tm = time.localtime(timestamp)
+                writer.write("{},{:04d}-{:02d}-{:02d},{:02d}:{:02d}:{:02d},{},{}\n".format(
+                    seq, tm[0], tm[1], tm[2], tm[3], tm[4], tm[5], temperature, humidity).encode())
+
+            await writer.drain()
+            reply = (await reader.readline()).decode().split()
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+        if len(reply) != 2 or reply[0] != "ACK":
+            raise OSError("Unexpected reply from collector.")
+
+        return int(reply[1])
+
+    async def push(self) -> int:
+        """Send one batch from the outbox. Returns the number acknowledged."""
+        start = self.outbox.first
+        end = min(self.outbox.next, start + self.batch_size)
+
+        if start == end:
+            return 0
+
+        acked = await asyncio.wait_for_ms(self._send_batch(start, end), self.timeout_ms)
+        self.outbox.discard_before(acked + 1)
+        return max(0, acked + 1 - start)
+
+    async def run(self, period_s: int = 300):
+        """Push everything waiting in the outbox every period_s seconds."""
+        while True:
+            if self.online is None or self.online():
+                self.pushing = True
+
+                try:
+                    while len(self.outbox) and await self.push():
+                        pass
+                except Exception as e:
+                    print(f"Telemetry push failed: {e}")
+                finally:
+                    self.pushing = False
+
+            await asyncio.sleep(period_s)
@@ -0,0 +1,108 @@
+"""Reference collector for readings pushed by thermoclocks (see telemetry.py).
+
+Listens for batches over TCP, writes the rows (tagged with the device's id)
+into the same table that house_graphs_gui_template.import_data() fills, and
+acknowledges them by sequence number. The highest sequence number stored for
+each device and outbox epoch is kept in a small JSON file, so batches resent
+after a lost ACK are not inserted twice, and a device whose outbox was
+recreated (and whose sequence numbers start again) is not mistaken for one
+resending rows already stored. Batches from devices too old to send an epoch
+are keyed on the device alone. Rows already in the table by another route,
+such as a CSV import, are left out too (see DataStore.insert_new()).
+
+Usage: python telemetry_collector.py [port] [state file]
+"""
+import asyncio
+import json
+import sys
+from os import path
+
+from pandas import DataFrame
+
+from house_graphs_gui_template import DataStore, get_database_credentials
+
+DEFAULT_PORT = 5005
+DEFAULT_STATE_FILE = "collector_state.json"
+
+
+class Collector:
+    def __init__(self, store, state_file):
+        self.store = store
+        self.state_file = state_file
+        self.last_seq = {}
+        self.lock = asyncio.Lock()
+
+        if path.exists(state_file):
+            with open(state_file) as f:
+                self.last_seq = json.load(f)
+
+    def save_state(self):
+        with open(self.state_file, "w") as f:
+            json.dump(self.last_seq, f)
+
+    def store_rows(self, device, epoch, rows):
+        """Insert the rows not already stored and return the new highest sequence number."""
+        key = f"{device} {epoch}" if epoch else device
+        last = self.last_seq.get(key, -1)
+        new_rows = [row for row in rows if row[0] > last]
+
+        if new_rows:
+            data = DataStore.normalise(DataFrame(
+                [(device,) + row[1:] for row in new_rows],
+                columns=['Device', 'Date', 'Time', 'Temp', 'Humidity']
+            ))
+            with self.store.engine.begin() as connection:
+                self.store.insert_new(connection, data)
+            last = max(row[0] for row in new_rows)
+            self.last_seq[key] = last
+            self.save_state()
+
+        return last
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+
+        try:
+            header = (await reader.readline()).decode().split()
+
+            if len(header) not in (3, 4) or header[0] != "BATCH":
+                raise ValueError(f"Bad batch header: {header}")
+
+            device, count = header[1], int(header[-1])
+            epoch = header[2] if len(header) == 4 else None
+            rows = []
+
+            for _ in range(count):
+                seq, date, time, temperature, humidity = (await reader.readline()).decode().strip().split(',')
+                rows.append((int(seq), date, time, float(temperature), float(humidity)))
+
+            # Inserts are run one at a time, off the event loop
+            async with self.lock:
+                last = await asyncio.get_running_loop().run_in_executor(None, self.store_rows, device, epoch, rows)
+
+            writer.write(f"ACK {last}\n".encode())
+            await writer.drain()
+            print(f"{device} ({peer[0]}): {count} rows received, acknowledged up to {last}")
+        except Exception as e:
+            print(f"Error from {peer}: {e}")
+        finally:
+            writer.close()
+
+
+async def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    state_file = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_STATE_FILE
+
+    store = DataStore(*get_database_credentials())
+    store.migrate()
+    collector = Collector(store, state_file)
+
+    server = await asyncio.start_server(collector.handle, '0.0.0.0', port)
+    print(f"Collector listening on port {port}...")
+
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
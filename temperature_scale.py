@@ -0,0 +1,63 @@
+class TemperatureScale:
+    """Lookup tables mapping a temperature to a ring LED and colour.
+
+    The scale covers centre ± span °C in steps of resolution °C. Each step
+    has an LED position, with the centre step on top_led, and a colour
+    interpolated along a gradient. Both tables are built once, so a reading
+    is turned into a step with integer arithmetic alone, straight from the
+    DHT20's raw ADC value or from centi-degrees.
+
+    steps: the number of steps on the scale,
+    positions: the LED index for each step,
+    colours: the colour tuple for each step
+    """
+
+    def __init__(self, centre: float, span: float, resolution: float, ring_size: int,
+                 top_led: int, gradient):
+        """Keyword arguments:
+        centre -- the ideal temperature (°C), shown on top_led
+        span -- how far the scale extends either side of the centre (°C)
+        resolution -- the temperature change (°C) between neighbouring steps
+        ring_size -- the number of LEDs on the ring
+        top_led -- the index of the LED at the top of the ring
+        gradient -- colour tuples spaced evenly from the coldest step to the hottest
+        """
+        self.resolution = round(resolution * 100)
+        self.min_centi = round((centre - span) * 100)
+        self.steps = round(2 * span * 100) // self.resolution + 1
+        self.max_centi = self.min_centi + (self.steps - 1) * self.resolution
+        centre_step = (self.steps - 1) // 2
+
+        self.positions = bytearray(self.steps)
+        self.colours = []
+
+        for step in range(self.steps):
+            self.positions[step] = (top_led + step - centre_step) % ring_size
+            self.colours.append(self._interpolate(gradient, step / max(1, self.steps - 1)))
+
+    @staticmethod
+    def _interpolate(gradient, fraction: float) -> tuple:
+        if len(gradient) == 1:
+            return tuple(gradient[0])
+
+        position = fraction * (len(gradient) - 1)
+        stop = min(int(position), len(gradient) - 2)
+        weight = position - stop
+        start = gradient[stop]
+        end = gradient[stop + 1]
+        return tuple(round(start[i] + (end[i] - start[i]) * weight) for i in range(len(start)))
+
+    @staticmethod
+    def centi_from_adc(t_adc: int) -> int:
+        """Convert a raw 20-bit DHT20 temperature to centi-degrees, rounded."""
+        return ((t_adc * 20000 + (1 << 19)) >> 20) - 5000
+
+    def step(self, centi: int) -> int:
+        """The nearest step for a temperature in centi-degrees, clamped to the scale."""
+        if centi <= self.min_centi:
+            return 0
+
+        if centi >= self.max_centi:
+            return self.steps - 1
+
+        return (centi - self.min_centi + self.resolution // 2) // self.resolution
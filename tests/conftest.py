@@ -0,0 +1,171 @@
+"""Stand-ins for the MicroPython modules, so the firmware can be tested under CPython.
+
+Only what the firmware touches is provided. The I2C bus answers as an idle
+DHT20 reading about 20 °C and 40 %RH, and uasyncio.run() does not start the
+main loop, so importing pico_thermoclock only runs its boot code.
+"""
+import asyncio
+import importlib
+import os
+import sys
+import time
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _module(module_name, **attributes):
+    module = types.ModuleType(module_name)
+    module.__dict__.update(attributes)
+    sys.modules[module_name] = module
+    return module
+
+
+def _crc8(data):
+    crc = 0xFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x31) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+class Pin:
+    OUT = 1
+    IN = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def on(self):
+        pass
+
+    def off(self):
+        pass
+
+    def value(self, *args):
+        return 0
+
+
+class ADC:
+    def __init__(self, *args):
+        pass
+
+    def read_u16(self):
+        return 65535
+
+
+class I2C:
+    # Status, 20 bits of humidity and 20 bits of temperature
+    reading = bytes([0x18, 0x66, 0x66, 0x05, 0x99, 0x99])
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def writeto(self, address, buffer, stop=True):
+        pass
+
+    def readfrom_into(self, address, buffer):
+        if len(buffer) == 7:
+            buffer[:6] = self.reading
+            buffer[6] = _crc8(self.reading)
+        else:
+            buffer[:] = bytes([0x18]) * len(buffer)
+
+    def readfrom(self, address, n):
+        return bytes([0x18]) * n
+
+    def writeto_mem(self, *args):
+        pass
+
+    def readfrom_mem(self, address, register, n):
+        return bytes([0x18]) * n
+
+
+class UART:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def init(self, *args, **kwargs):
+        pass
+
+
+class RTC:
+    def datetime(self, *args):
+        pass
+
+
+class NeoPixel:
+    ORDER = (1, 0, 2, 3)
+    bpp = 3
+
+    def __init__(self, pin, n):
+        self.n = n
+        self.buf = bytearray(3 * n)
+
+    def write(self):
+        pass
+
+
+class WLAN:
+    def __init__(self, *args):
+        pass
+
+    def active(self, *args):
+        return True
+
+    def isconnected(self):
+        return False
+
+
+def _run(coroutine):
+    coroutine.close()
+
+
+async def _sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+def _ticks_ms():
+    return int(time.monotonic() * 1000)
+
+
+_module("machine", Pin=Pin, ADC=ADC, I2C=I2C, UART=UART, RTC=RTC,
+        lightsleep=lambda ms: None, reset=lambda: None)
+_module("neopixel", NeoPixel=NeoPixel)
+_module("network", STA_IF=0, WLAN=WLAN)
+_module("uos", **{name: getattr(os, name) for name in dir(os) if not name.startswith("__")},
+        dupterm=lambda *args: None)
+_module("utime", sleep_ms=lambda ms: time.sleep(ms / 1000), ticks_ms=_ticks_ms,
+        ticks_diff=lambda a, b: a - b)
+_module("uasyncio", **{name: getattr(asyncio, name) for name in dir(asyncio) if not name.startswith("__")})
+sys.modules["uasyncio"].run = _run
+sys.modules["uasyncio"].sleep_ms = _sleep_ms
+sys.modules["uasyncio"].wait_for_ms = lambda awaitable, ms: asyncio.wait_for(awaitable, ms / 1000)
+
+# MicroPython's time has the ticks functions and returns whole seconds
+time.ticks_ms = _ticks_ms
+time.ticks_diff = lambda a, b: a - b
+time.ticks_add = lambda a, b: a + b
+time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+_mktime = time.mktime
+time.mktime = lambda t: int(_mktime(tuple(t[:8]) + (-1,)))
+
+
+@pytest.fixture
+def thermoclock(tmp_path, monkeypatch):
+    """Boot pico_thermoclock in an empty directory, with some constants overridden."""
+    monkeypatch.chdir(tmp_path)
+    constants = importlib.import_module("pico_thermoclock_constants")
+
+    def boot(**overrides):
+        for name, value in overrides.items():
+            monkeypatch.setattr(constants, name, value)
+        sys.modules.pop("pico_thermoclock", None)
+        return importlib.import_module("pico_thermoclock")
+
+    yield boot
+    sys.modules.pop("pico_thermoclock", None)
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+
+def test_empty_ring_log_is_written_to(thermoclock):
+    clock = thermoclock(LOG_STORAGE="ring")
+    assert clock.log is not None and len(clock.log) == 0
+
+    now = time.localtime(time.mktime((2024, 3, 1, 12, 0, 0, 0, 0, 0)))
+    clock.write_data(now, 20.5, 40.0)
+
+    assert len(clock.log) == 1
+    assert clock.log.last()[0] == time.mktime(now)
+
+
+def test_drift_correction_does_not_log_twice(thermoclock):
+    clock = thermoclock(LOG_STORAGE="ring")
+    clock.time_sync.synced = True
+    rtc = [time.mktime((2024, 3, 1, 11, 59, 0, 0, 0, 0))]
+    clock.scheduler._clock = lambda: rtc[0]
+    clock.scheduler.reschedule()
+
+    rtc[0] += 60
+    clock.scheduler.run_pending()
+    assert len(clock.log) == 1
+    assert clock.display.take_chime() == 12
+
+    # Drift correction sets the RTC back a second, then it catches up
+    rtc[0] -= 1
+    clock.on_clock_step(-1)
+    clock.scheduler.run_pending()
+    rtc[0] += 1
+    clock.scheduler.run_pending()
+    assert len(clock.log) == 1
+    assert clock.display.take_chime() == -1
+
+
+def test_boots_without_a_sensor(thermoclock, monkeypatch):
+    import machine
+    from pico_thermoclock_constants import DHT20_ADDRESS
+
+    unplugged = [True]
+
+    def sensor_only(method):
+        # Only the DHT20 is missing; the LCD on the same bus still answers
+        def transfer(self, address, *args):
+            if address == DHT20_ADDRESS and unplugged[0]:
+                raise OSError(19)
+            return method(self, address, *args)
+        return transfer
+
+    for name in ("writeto", "readfrom", "readfrom_into", "writeto_mem"):
+        monkeypatch.setattr(machine.I2C, name, sensor_only(getattr(machine.I2C, name)))
+
+    clock = thermoclock(LOG_STORAGE="ring")
+
+    assert not clock.dht20.initialized
+    assert clock.tempnow is None and clock.server is not None
+    clock.render_lcd(clock.display)
+    clock.time_sync.synced = True
+    clock.on_log(time.mktime((2024, 3, 1, 12, 0, 0, 0, 0, 0)), 0)
+    assert len(clock.log) == 0
+
+    # The sensor is probed and read again once it answers
+    unplugged[0] = False
+    asyncio.run(one_sample(clock))
+    assert clock.dht20.initialized
+    assert clock.tempnow is not None and clock.lowtemp == clock.tempnow
+
+
+async def one_sample(clock):
+    task = asyncio.ensure_future(clock.sensor_task())
+    await asyncio.sleep(0.2)
+    task.cancel()
+
+
+def test_no_light_sleep_while_wifi_is_up(thermoclock, monkeypatch):
+    import machine
+    from wifi_manager import CONNECTED
+
+    slept = []
+    monkeypatch.setattr(machine, "lightsleep", slept.append)
+    clock = thermoclock(LOW_POWER=True)
+    clock.lcd.backlight = False
+
+    clock.wifi.state = CONNECTED
+    asyncio.run(one_sample(clock))
+    assert not slept and clock.power.skipped == 1
+
+    clock.wifi.state = clock.DISCONNECTED
+    asyncio.run(one_sample(clock))
+    assert slept and clock.power.sleeps == 1
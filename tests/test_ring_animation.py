@@ -0,0 +1,23 @@
+from neopixel import NeoPixel
+from ring_animation import RingAnimator
+
+
+class RGBWRing(NeoPixel):
+    ORDER = (1, 0, 2, 3)
+    bpp = 4
+
+    def __init__(self, pin, n):
+        self.n = n
+        self.buf = bytearray(4 * n)
+
+
+def test_rgb_colours_on_an_rgbw_ring():
+    animator = RingAnimator(RGBWRing(None, 12))
+
+    animation = animator.pulse((10, 20, 30), 2)
+    for _ in animator.frames(animation):
+        pass
+
+    animator.set_overlay(3, (1, 2, 3))
+    animator.show()
+    assert animator.ring.buf[12:16] == bytes((2, 1, 3, 0))
@@ -0,0 +1,64 @@
+from scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_small_backwards_step_does_not_repeat_an_occurrence():
+    clock = FakeClock(10000)
+    scheduler = Scheduler(clock)
+    fired = []
+    scheduler.every("log", 1800, lambda due, lateness: fired.append(due))
+
+    clock.now = 10800
+    assert scheduler.run_pending() == 1
+    assert fired == [10800]
+
+    # A drift correction steps the RTC back a second
+    clock.now = 10799
+    scheduler.run_pending()
+    clock.now = 10800
+    scheduler.run_pending()
+    assert fired == [10800]
+
+    # The following occurrence still fires on time
+    clock.now = 12600
+    scheduler.run_pending()
+    assert fired == [10800, 12600]
+
+
+def test_large_backwards_step_starts_again():
+    clock = FakeClock(10000)
+    scheduler = Scheduler(clock)
+    fired = []
+    scheduler.every("log", 1800, lambda due, lateness: fired.append(due))
+
+    clock.now = 10800
+    scheduler.run_pending()
+
+    # Set back by more than an interval, e.g. an RTC which was far ahead
+    clock.now = 5000
+    scheduler.run_pending()
+    clock.now = 5400
+    scheduler.run_pending()
+    assert fired == [10800, 5400]
+
+
+def test_reschedule_does_not_repeat_an_occurrence():
+    clock = FakeClock(10000)
+    scheduler = Scheduler(clock)
+    fired = []
+    scheduler.every("chime", 3600, lambda due, lateness: fired.append(due))
+
+    clock.now = 10800
+    scheduler.run_pending()
+    clock.now = 10790
+    scheduler.reschedule()
+    clock.now = 10800
+    scheduler.run_pending()
+    assert fired == [10800]
@@ -0,0 +1,34 @@
+import os
+
+from ring_log import RingLog
+from telemetry import Telemetry
+
+
+def open_telemetry(path, capacity=16):
+    return Telemetry("collector", 5005, "lounge", RingLog(str(path), capacity))
+
+
+def test_epoch_is_kept_while_the_outbox_is(tmp_path):
+    outbox = tmp_path / "outbox.bin"
+    first = open_telemetry(outbox)
+    first.record(1700000000, 20.5, 40.0)
+    first.outbox.close()
+
+    assert open_telemetry(outbox).epoch == first.epoch
+
+
+def test_recreated_outbox_gets_a_new_epoch(tmp_path):
+    outbox = tmp_path / "outbox.bin"
+    first = open_telemetry(outbox)
+    first.outbox.close()
+    os.remove(outbox)
+
+    second = open_telemetry(outbox)
+    assert second.outbox.next == 0
+    assert second.epoch != first.epoch
+
+    # As does a damaged header
+    second.outbox.close()
+    with open(outbox, "r+b") as f:
+        f.write(b"XXXX")
+    assert open_telemetry(outbox).epoch != second.epoch
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from web_server import RequestError, WebServer
+
+
+def read_request(data, max_line=64):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await WebServer()._read_request(reader, max_line)
+
+    return asyncio.run(run())
+
+
+def test_request_is_parsed():
+    request = read_request(b"GET /data?since=5 HTTP/1.1\r\nHost: clock\r\nRange: bytes=0-9\r\n\r\n")
+    assert (request.method, request.path, request.query) == ("GET", "/data", {"since": "5"})
+    assert request.headers == {"host": "clock", "range": "bytes=0-9"}
+
+
+def test_long_request_line_is_refused():
+    with pytest.raises(RequestError) as error:
+        read_request(b"GET /" + b"a" * 1000)
+    assert error.value.status == 414
+
+
+def test_long_header_line_is_refused():
+    with pytest.raises(RequestError) as error:
+        read_request(b"GET / HTTP/1.1\r\nCookie: " + b"a" * 1000 + b"\r\n\r\n")
+    assert error.value.status == 431
+
+
+def test_undecodable_request_is_malformed():
+    assert read_request(b"GET /\xff\xfe HTTP/1.1\r\n\r\n") is None
+    assert read_request(b"GET / HTTP/1.1\r\nHost: \xff\r\n\r\n") is None
+    assert read_request(b"") is None
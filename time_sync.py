@@ -0,0 +1,221 @@
+import machine
+import socket
+import struct
+import time
+import uasyncio as asyncio
+
+# Resolve the server again after this many failed queries in a row
+MAX_FAILURES = 3
+
+# How soon to retry after a failed query (s)
+RETRY_INTERVAL_S = 300
+
+
+class TimeSync:
+    """Keeps the RTC on local time using NTP, without rebooting.
+
+    The server address is resolved once and cached. Each sync measures how
+    far the RTC has drifted since the last one, and the drift rate is used
+    to nudge the RTC a second at a time in between. The interval between
+    syncs doubles while the RTC stays within a second and halves when it
+    does not. Daylight saving (EU rules: last Sunday of March and October at
+    01:00 UTC) is worked out once per year, and the RTC is moved by an hour
+    at each transition without needing the network.
+
+    synced: whether the RTC has been set from NTP since boot,
+    drift: the measured drift rate of the RTC (s per s, positive if fast),
+    interval: the current time between syncs (s)
+    """
+
+    def __init__(self, host: str, ntp_delta: int, utc_offset: int = 0, dst: bool = True,
+                 min_interval: int = 3600, max_interval: int = 4 * 86400,
+                 timeout_ms: int = 1000, on_step=None, on_sync=None, online=None):
+        """Keyword arguments:
+        host -- the NTP server
+        ntp_delta -- seconds between the NTP epoch (1900) and the time epoch
+        utc_offset -- the standard time offset from UTC (s)
+        dst -- whether to apply daylight saving
+        min_interval -- the shortest time between syncs (s)
+        max_interval -- the longest time between syncs (s)
+        timeout_ms -- how long to wait for a reply
+        on_step -- called with the number of seconds the RTC was moved by,
+                   whenever it is moved by a second or more
+        on_sync -- called with the measured error (s) after each successful sync
+        online -- returns whether the network is up; syncs wait until it is
+        """
+        self.host = host
+        self.ntp_delta = ntp_delta
+        self.utc_offset = utc_offset
+        self.dst = dst
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout_ms = timeout_ms
+        self.on_step = on_step
+        self.on_sync = on_sync
+        self.online = online
+        self.synced = False
+        self.drift = 0.0
+        self.interval = min_interval
+        self._query = bytearray(48)
+        self._address = None
+        self._failures = 0
+        self._last_sync = 0
+        self._next_sync = 0
+        self._corrected = 0
+        self._applied_offset = utc_offset
+        self._dst_year = None
+        self._dst_start = 0
+        self._dst_end = 0
+
+    @staticmethod
+    def _last_sunday(year: int, month: int) -> int:
+        # Day of the month of the last Sunday, for months with 31 days.
+        # gmtime() counts weekdays from Monday = 0.
+        weekday = time.gmtime(time.mktime((year, month, 31, 0, 0, 0, 0, 0, 0)))[6]
+        return 31 - (weekday + 1) % 7
+
+    def offset_for(self, utc: int) -> int:
+        """The local time offset from UTC (s) at a given UTC time."""
+        if not self.dst:
+            return self.utc_offset
+
+        year = time.gmtime(utc)[0]
+
+        if year != self._dst_year:
+            # Only worked out once a year
+            self._dst_year = year
+            self._dst_start = time.mktime((year, 3, self._last_sunday(year, 3), 1, 0, 0, 0, 0, 0))
+            self._dst_end = time.mktime((year, 10, self._last_sunday(year, 10), 1, 0, 0, 0, 0, 0))
+
+        if self._dst_start <= utc < self._dst_end:
+            return self.utc_offset + 3600
+
+        return self.utc_offset
+
+    def utc(self) -> int:
+        """The current UTC time according to the RTC."""
+        return time.time() - self._applied_offset
+
+    def _set_rtc(self, utc: int):
+        offset = self.offset_for(utc)
+        tm = time.gmtime(utc + offset)
+        machine.RTC().datetime((tm[0], tm[1], tm[2], tm[6], tm[3], tm[4], tm[5], 0))
+        self._applied_offset = offset
+
+    def _step(self, seconds: int):
+        if seconds and self.on_step:
+            self.on_step(seconds)
+
+    async def _request(self) -> int:
+        # A non-blocking query: the reply is polled for between sleeps, so
+        # the other tasks keep running while we wait
+        if self._address is None:
+            self._address = socket.getaddrinfo(self.host, 123)[0][-1]
+
+        self._query[0] = 0x1B
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        try:
+            s.setblocking(False)
+            s.sendto(self._query, self._address)
+            waited = 0
+
+            while True:
+                try:
+                    reply = s.recv(48)
+                    break
+                except OSError:
+                    if waited >= self.timeout_ms:
+                        raise
+
+                await asyncio.sleep_ms(20)
+                waited += 20
+        finally:
+            s.close()
+
+        seconds, fraction = struct.unpack("!II", reply[40:48])
+        # Round to the nearest second using the fraction
+        return seconds - self.ntp_delta + (fraction >> 31)
+
+    async def sync(self) -> bool:
+        """Set the RTC from NTP and update the drift estimate.
+
+        Returns False if the server could not be reached.
+        """
+        try:
+            ntp = await self._request()
+        except OSError as e:
+            print(f"NTP sync failed: {e}")
+            self._failures += 1
+
+            if self._failures >= MAX_FAILURES:
+                self._address = None
+                self._failures = 0
+
+            self._next_sync = self.utc() + min(RETRY_INTERVAL_S, self.interval)
+            return False
+
+        self._failures = 0
+        error = self.utc() - ntp
+
+        if self.synced:
+            # What the error would have been without the corrections applied
+            elapsed = ntp - self._last_sync
+
+            if elapsed > 0:
+                drift = (error - self._corrected) / elapsed
+                self.drift = (self.drift + drift) / 2
+
+            if abs(error) <= 1:
+                self.interval = min(self.interval * 2, self.max_interval)
+            else:
+                self.interval = max(self.interval // 2, self.min_interval)
+
+        self._set_rtc(ntp)
+        self.synced = True
+        self._last_sync = ntp
+        self._next_sync = ntp + self.interval
+        self._corrected = 0
+        print(f"NTP sync: RTC was {error} s out, next sync in {self.interval} s")
+
+        if abs(error) >= 1:
+            self._step(-error)
+
+        if self.on_sync:
+            self.on_sync(error)
+
+        return True
+
+    def correct(self):
+        """Apply the drift correction and any daylight saving change due."""
+        if not self.synced:
+            return
+
+        utc = self.utc()
+
+        if self.offset_for(utc) != self._applied_offset:
+            previous = self._applied_offset
+            self._set_rtc(utc)
+            self._step(self._applied_offset - previous)
+            return
+
+        # The error the drift rate predicts, less what has been corrected
+        predicted = int(self.drift * (utc - self._last_sync)) + self._corrected
+
+        if predicted:
+            self._set_rtc(utc - predicted)
+            self._corrected -= predicted
+            self._step(-predicted)
+
+    async def run(self, period_s: int = 60):
+        """Sync whenever one is due and apply corrections in between.
+
+        Until the first sync succeeds the network is checked every few
+        seconds, so the clock is set soon after the connection comes up.
+        """
+        while True:
+            if self.utc() >= self._next_sync and (self.online is None or self.online()):
+                await self.sync()
+
+            self.correct()
+            await asyncio.sleep(period_s if self.synced else 5)
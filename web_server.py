@@ -0,0 +1,429 @@
+import uasyncio as asyncio
+import uos
+
+STATUS_TEXT = {
+    200: "OK",
+    206: "Partial Content",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    414: "URI Too Long",
+    416: "Range Not Satisfiable",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+# Requests with more header lines than this are rejected
+MAX_HEADERS = 24
+
+
+def unquote(string: str) -> str:
+    """Decode %xx escapes and '+' in a URL query component."""
+    if '%' not in string and '+' not in string:
+        return string
+
+    string = string.replace('+', ' ')
+    parts = string.split('%')
+    decoded = [parts[0]]
+
+    for part in parts[1:]:
+        try:
+            decoded.append(chr(int(part[:2], 16)) + part[2:])
+        except ValueError:
+            decoded.append('%' + part)
+
+    return ''.join(decoded)
+
+
+def parse_query(query: str) -> dict:
+    """Split a query string such as 'a=1&b=2' into a dictionary."""
+    params = {}
+
+    for pair in query.split('&'):
+        if not pair:
+            continue
+
+        name, _, value = pair.partition('=')
+        params[unquote(name)] = unquote(value)
+
+    return params
+
+
+def parse_range(value: str, size: int):
+    """Parse a 'Range: bytes=...' header for a resource of a given size.
+
+    Only a single range is supported. Returns (offset, length), or None if
+    the header should be ignored and the whole resource sent. Raises
+    ValueError if the range cannot be satisfied.
+
+    Keyword arguments:
+    value -- the value of the Range header, e.g. 'bytes=100-199'
+    size -- the size of the resource in bytes
+    """
+    unit, _, spec = value.partition('=')
+
+    if unit.strip() != "bytes" or ',' in spec:
+        return None
+
+    first, _, last = spec.strip().partition('-')
+
+    try:
+        if first:
+            offset = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # A suffix range: the final N bytes
+            suffix = int(last)
+    except ValueError:
+        # Malformed ranges are ignored rather than rejected
+        return None
+
+    if not first:
+        if suffix <= 0 or not size:
+            raise ValueError("Empty suffix range.")
+
+        offset = max(0, size - suffix)
+        return offset, size - offset
+
+    if end < offset:
+        return None
+
+    if offset >= size:
+        raise ValueError("Range starts beyond the end of the resource.")
+
+    return offset, min(end, size - 1) - offset + 1
+
+
+class RequestError(Exception):
+    """A request which is refused with a status other than 400."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class LineReader:
+    """Reads lines from a stream, refusing any longer than a limit.
+
+    StreamReader.readline() keeps reading until it finds a newline, so one
+    client sending a line which never ends could use up the heap. Here at
+    most limit bytes of a line are ever held.
+    """
+
+    __slots__ = ('reader', 'limit', 'pending')
+
+    def __init__(self, reader, limit: int):
+        """Keyword arguments:
+        reader -- the stream to read from
+        limit -- the longest line accepted, in bytes
+        """
+        self.reader = reader
+        self.limit = limit
+        self.pending = b""
+
+    async def readline(self):
+        """Return the next line without its line ending, or None at the end of the stream.
+
+        Raises ValueError if the line is longer than the limit.
+        """
+        while True:
+            end = self.pending.find(b"\n")
+
+            if end >= 0:
+                line = self.pending[:end]
+                self.pending = self.pending[end + 1:]
+                return line[:-1] if line.endswith(b"\r") else line
+
+            if len(self.pending) >= self.limit:
+                raise ValueError("Line too long.")
+
+            data = await self.reader.read(self.limit - len(self.pending))
+
+            if not data:
+                # The end of the stream; any unfinished line is the last
+                line = self.pending or None
+                self.pending = b""
+                return line
+
+            self.pending += data
+
+
+class Request:
+    """A parsed HTTP request line and its headers.
+
+    method: the request method, e.g. 'GET',
+    path: the path without the query string, e.g. '/data.csv',
+    query: dictionary of query string parameters,
+    headers: dictionary of headers, with lower case names
+    """
+
+    __slots__ = ('method', 'path', 'query', 'headers')
+
+    def __init__(self, method: str, path: str, query: dict, headers: dict):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+
+
+class Response:
+    """Writes a response to one client, using a buffer borrowed from the server."""
+
+    __slots__ = ('writer', 'buffer', 'started')
+
+    def __init__(self, writer, buffer: bytearray):
+        self.writer = writer
+        self.buffer = buffer
+        self.started = False
+
+    async def start(self, status: int, content_type: str, length: int = None, headers: str = ""):
+        """Send the status line and headers.
+
+        Keyword arguments:
+        status -- the HTTP status code
+        content_type -- the value of the Content-Type header
+        length -- the body length in bytes, if known
+        headers -- any extra header lines, each ending in CRLF
+        """
+        head = "HTTP/1.1 {} {}\r\nContent-Type: {}\r\nConnection: close\r\n".format(
+            status, STATUS_TEXT.get(status, ""), content_type)
+
+        if length is not None:
+            head += "Content-Length: {}\r\n".format(length)
+
+        self.started = True
+        self.writer.write((head + headers + "\r\n").encode())
+        await self.writer.drain()
+
+    async def write(self, data):
+        """Send part of the body."""
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def send(self, status: int, content_type: str, body: str, headers: str = ""):
+        """Send a complete response with a small in-memory body."""
+        body = body.encode()
+        await self.start(status, content_type, len(body), headers)
+        await self.write(body)
+
+    async def send_file(self, path: str, content_type: str, offset: int = 0, length: int = None,
+                        status: int = 200, headers: str = ""):
+        """Stream part or all of a file in buffer-sized chunks.
+
+        The file is never held in memory as a whole, so it can be far larger
+        than the free heap.
+
+        Keyword arguments:
+        path -- the file to send
+        content_type -- the value of the Content-Type header
+        offset -- the first byte to send
+        length -- the number of bytes to send, or None for the rest of the file
+        status -- the HTTP status code
+        headers -- any extra header lines, each ending in CRLF
+        """
+        if length is None:
+            length = uos.stat(path)[6] - offset
+
+        await self.start(status, content_type, length, headers)
+
+        view = memoryview(self.buffer)
+        chunk_size = len(self.buffer)
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+
+            while length > 0:
+                n = f.readinto(view[:min(chunk_size, length)])
+
+                if not n:
+                    break
+
+                self.writer.write(view[:n])
+                await self.writer.drain()
+                length -= n
+
+    async def send_file_range(self, request: Request, path: str, content_type: str, headers: str = ""):
+        """Stream a file, honouring a single byte range if the client asked for one.
+
+        Keyword arguments:
+        request -- the request, whose Range header is used if present
+        path -- the file to send
+        content_type -- the value of the Content-Type header
+        headers -- any extra header lines, each ending in CRLF
+        """
+        size = uos.stat(path)[6]
+        headers = "Accept-Ranges: bytes\r\n" + headers
+        value = request.headers.get("range")
+
+        try:
+            byte_range = parse_range(value, size) if value else None
+        except ValueError:
+            await self.send(416, "text/plain", "Range not satisfiable.",
+                            "Content-Range: bytes */{}\r\n".format(size) + headers)
+            return
+
+        if byte_range is None:
+            await self.send_file(path, content_type, 0, size, 200, headers)
+            return
+
+        offset, length = byte_range
+        await self.send_file(path, content_type, offset, length, 206,
+                             "Content-Range: bytes {}-{}/{}\r\n".format(offset, offset + length - 1, size) + headers)
+
+
+class WebServer:
+    """A small non-blocking HTTP/1.1 server for uasyncio.
+
+    Handlers are registered per path with route() and are called as
+    `await handler(request, response)`. Several clients are served at once,
+    each with its own preallocated chunk buffer. A client arriving when all
+    buffers are in use waits for one to be freed, and gets a 503 if none is
+    freed within the request timeout. No line of a request may be longer
+    than the buffer.
+
+    connections: the number of clients connected, including any waiting
+    """
+
+    def __init__(self, port: int = 80, backlog: int = 4, max_clients: int = 3,
+                 chunk_size: int = 512, timeout_ms: int = 5000):
+        """Keyword arguments:
+        port -- the TCP port to listen on
+        backlog -- the listen backlog for pending connections
+        max_clients -- the number of clients served concurrently
+        chunk_size -- the size of each client's transfer buffer in bytes
+        timeout_ms -- how long a client may take to send its request
+        """
+        self.port = port
+        self.backlog = backlog
+        self.timeout_ms = timeout_ms
+        self._buffers = [bytearray(chunk_size) for _ in range(max_clients)]
+        self._routes = {}
+        self._server = None
+        self.connections = 0
+
+    def route(self, path: str, handler):
+        """Register a coroutine function to handle requests for a path."""
+        self._routes[path] = handler
+
+    async def start(self):
+        """Start listening. Clients are then handled by the scheduler."""
+        self._server = await asyncio.start_server(self._handle, '0.0.0.0', self.port, backlog=self.backlog)
+        print("Web server running...")
+
+    async def _read_request(self, reader, max_line: int):
+        # Returns None if the request is malformed, and raises RequestError
+        # if it is too large
+        lines = LineReader(reader, max_line)
+
+        try:
+            line = await lines.readline()
+        except ValueError:
+            raise RequestError(414, "Request line too long.")
+
+        try:
+            parts = line.decode().split() if line else []
+        except UnicodeError:
+            return None
+
+        if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+            return None
+
+        method, target, _ = parts
+        path, _, query = target.partition('?')
+        headers = {}
+
+        while True:
+            try:
+                line = await lines.readline()
+            except ValueError:
+                raise RequestError(431, "Header line too long.")
+
+            if not line:
+                break
+
+            if len(headers) >= MAX_HEADERS:
+                raise RequestError(431, "Too many headers.")
+
+            try:
+                name, _, value = line.decode().partition(':')
+            except UnicodeError:
+                return None
+
+            headers[name.strip().lower()] = value.strip()
+
+        return Request(method, path, parse_query(query), headers)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+
+        try:
+            await self._serve(reader, writer)
+        finally:
+            self.connections -= 1
+
+    async def _serve(self, reader, writer):
+        # Wait a little for a buffer if every client slot is busy
+        waited = 0
+
+        while not self._buffers and waited < self.timeout_ms:
+            await asyncio.sleep_ms(20)
+            waited += 20
+
+        if not self._buffers:
+            response = Response(writer, None)
+
+            try:
+                await response.send(503, "text/plain", "Server busy, try again.")
+            except Exception:
+                pass
+
+            await self._close(writer)
+            return
+
+        buffer = self._buffers.pop()
+        response = Response(writer, buffer)
+
+        try:
+            try:
+                request = await asyncio.wait_for_ms(self._read_request(reader, len(buffer)), self.timeout_ms)
+            except asyncio.TimeoutError:
+                await response.send(408, "text/plain", "Request timed out.")
+                return
+            except RequestError as e:
+                await response.send(e.status, "text/plain", e.message)
+                return
+
+            if request is None:
+                await response.send(400, "text/plain", "Malformed request.")
+                return
+
+            print(f"{request.method} {request.path}")
+            handler = self._routes.get(request.path)
+
+            if handler is None:
+                await response.send(404, "text/plain", "Not found.")
+            elif request.method != "GET":
+                await response.send(405, "text/plain", "Method not allowed.", "Allow: GET\r\n")
+            else:
+                await handler(request, response)
+        except Exception as e:
+            print(f"Error: {e}")
+
+            if not response.started:
+                try:
+                    await response.send(500, "text/plain", f"An error occurred: {e}")
+                except Exception:
+                    pass
+        finally:
+            self._buffers.append(buffer)
+            await self._close(writer)
+
+    async def _close(self, writer):
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
@@ -0,0 +1,98 @@
+import network
+import random
+import uasyncio as asyncio
+
+DISCONNECTED = 0
+CONNECTING = 1
+CONNECTED = 2
+
+
+class WifiManager:
+    """Keeps the WiFi connection up from a uasyncio task.
+
+    Connection attempts run in the background, so everything else carries
+    on (the clock from the RTC) while offline. Failed attempts are retried
+    with exponential backoff plus some jitter, and a dropped connection is
+    noticed and re-established automatically.
+
+    state: DISCONNECTED, CONNECTING or CONNECTED,
+    ip: the current IP address, or None,
+    attempts: connection attempts since the last successful one
+    """
+
+    def __init__(self, ssid: str, password: str, min_backoff_ms: int = 1000,
+                 max_backoff_ms: int = 300000, connect_timeout_ms: int = 15000,
+                 check_period_ms: int = 2000, on_change=None):
+        """Keyword arguments:
+        ssid -- the network to join
+        password -- the network password
+        min_backoff_ms -- the wait after the first failed attempt
+        max_backoff_ms -- the longest wait between attempts
+        connect_timeout_ms -- how long one attempt may take
+        check_period_ms -- how often to check the link while connected
+        on_change -- called with the manager whenever its state changes
+        """
+        self.ssid = ssid
+        self.password = password
+        self.min_backoff_ms = min_backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.connect_timeout_ms = connect_timeout_ms
+        self.check_period_ms = check_period_ms
+        self.on_change = on_change
+        self.state = DISCONNECTED
+        self.ip = None
+        self.attempts = 0
+        self._wlan = network.WLAN(network.STA_IF)
+
+    @property
+    def connected(self) -> bool:
+        return self.state == CONNECTED
+
+    def _set_state(self, state: int):
+        if state == self.state:
+            return
+
+        self.state = state
+        self.ip = self._wlan.ifconfig()[0] if state == CONNECTED else None
+        print(f"WiFi {('disconnected', 'connecting', 'connected')[state]}" + (f" on {self.ip}" if self.ip else ""))
+
+        if self.on_change:
+            self.on_change(self)
+
+    async def _connect(self) -> bool:
+        self._set_state(CONNECTING)
+        self.attempts += 1
+        self._wlan.connect(self.ssid, self.password)
+        waited = 0
+
+        while waited < self.connect_timeout_ms:
+            if self._wlan.isconnected():
+                return True
+
+            await asyncio.sleep_ms(250)
+            waited += 250
+
+        self._wlan.disconnect()
+        return False
+
+    async def run(self):
+        """Connect, and reconnect whenever the link is lost."""
+        self._wlan.active(True)
+        backoff = self.min_backoff_ms
+
+        while True:
+            if self._wlan.isconnected():
+                self.attempts = 0
+                backoff = self.min_backoff_ms
+                self._set_state(CONNECTED)
+                await asyncio.sleep_ms(self.check_period_ms)
+                continue
+
+            if await self._connect():
+                continue
+
+            self._set_state(DISCONNECTED)
+            # Up to a quarter extra, so that units which lost the network
+            # together do not all retry at the same moment
+            await asyncio.sleep_ms(backoff + backoff * random.getrandbits(8) // 1024)
+            backoff = min(backoff * 2, self.max_backoff_ms)